@@ -8,17 +8,17 @@ from flask_sqlalchemy import SQLAlchemy
 from config import Config
 from db import db
 from models import Payment, IdempotencyKey
+from idempotency import IdempotencyGuard, PeriodicJob, advisory_lock, compact_idempotency_keys
+from pool_stats import pool_stats
 from services.stripe_service import create_charge, refund_charge
-import random
-from datetime import datetime
+from transaction_ids import TransactionIdGenerator, node_id_from_env
 from flask_cors import CORS
+from datetime import datetime, timedelta
+import time
 
-# Generating transaction ID
-def generate_transaction_id():
-    while True:
-        new_id = f"txn-{random.randint(100000, 999999)}"
-        if not Payment.query.filter_by(transactionID=new_id).first():
-            return new_id
+# Generating transaction ID: time-ordered and unique without asking the
+# database. Replicas of this service must each get their own TRANSACTION_NODE_ID.
+generate_transaction_id = TransactionIdGenerator(node_id=node_id_from_env())
 
 # Configure logging
 # logging.basicConfig(level=logging.DEBUG)
@@ -31,11 +31,56 @@ CORS(app)  # Enable CORS for all routes
 db.init_app(app)
 # migrate = Migrate(app, db)
 
+# Idempotency keys older than this are deleted by the compaction job. Stripe
+# forgets its own keys after 24 hours, so keeping ours longer gains nothing.
+IDEMPOTENCY_RETENTION_HOURS = int(os.getenv("IDEMPOTENCY_RETENTION_HOURS", "24"))
+
+# Replays responses to repeated idempotency keys without calling Stripe again
+idempotency = IdempotencyGuard(
+    max_entries=int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", "10000")),
+    wait_timeout=int(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10")),
+    stale_after=int(os.getenv("IDEMPOTENCY_STALE_SECONDS", "60")),
+    max_age=IDEMPOTENCY_RETENTION_HOURS * 3600
+)
+
+# Deletes expired idempotency keys in batches, keeping the table and its
+# primary key index small
+# Every worker schedules the job, but a run only goes ahead in the one worker
+# (across all replicas) holding this advisory lock; the others skip it
+IDEMPOTENCY_COMPACTION_LOCK_ID = 213_025
+
+def compact_idempotency():
+    # Naive UTC, like IdempotencyKey.created_at
+    cutoff = datetime.utcnow() - timedelta(hours=IDEMPOTENCY_RETENTION_HOURS)
+    started = time.monotonic()
+    with app.app_context(), advisory_lock(db.engine, IDEMPOTENCY_COMPACTION_LOCK_ID) as acquired:
+        if not acquired:
+            return None
+        removed = compact_idempotency_keys(
+            cutoff, batch_size=int(os.getenv("IDEMPOTENCY_COMPACTION_BATCH_SIZE", "1000"))
+        )
+    print(f"Removed {removed} idempotency key(s) created before {cutoff.isoformat()} "
+          f"in {time.monotonic() - started:.1f}s")
+    return removed
+
+idempotency_compaction = PeriodicJob(
+    compact_idempotency,
+    interval=int(os.getenv("IDEMPOTENCY_COMPACTION_INTERVAL_SECONDS", "3600")),
+    name="idempotency-compaction"
+)
+if os.getenv("IDEMPOTENCY_COMPACTION_ENABLED", "true").lower() == "true":
+    idempotency_compaction.start()
+
 
 @app.route('/')
 def home():
     return jsonify({"message": "health check"}), 200
 
+# Connection pool usage and wait times of the worker that answers
+@app.route('/metrics/db-pool', methods=['GET'])
+def db_pool_metrics():
+    return jsonify(pool_stats(db.engine)), 200
+
 @app.route('/payment', methods=['POST'])
 def process_payment():
     """
@@ -61,84 +106,72 @@ def process_payment():
     if not all(field in data for field in required_fields):
         return jsonify({"error": f"Missing required fields. Required fields: {required_fields}"}), 400
 
-    # Generate transactionID
-    transaction_id = generate_transaction_id()
-
-    # convert amount to cents
-    amount_cents = int(data['amount'] * 100)
-
-    # Step 1: Create the charge via Stripe
-    stripe_response = create_charge(
-        amount=amount_cents,
-        currency=data['currency'],
-        source=data['source'],
-        chargeType="payment",
-        idempotencyKey=data['idempotency_key']
-    )
-
-    # Step 2: Handle failure
-    if "error" in stripe_response:
-        error_message = stripe_response["error"]
-
-        # Log failed payment attempt in idempotency cache
-        idempotency_key_record = IdempotencyKey(
-            key=data['idempotency_key'],
-            response={
-                "transactionID": transaction_id,
-                "message": f"Payment failed: {error_message}"
-            },
-            created_at=datetime.utcnow()
-        )
+    # Checked before the key is claimed, so a bad request never holds it
+    if isinstance(data['amount'], bool) or not isinstance(data['amount'], (int, float)) or data['amount'] <= 0:
+        return jsonify({"error": "amount must be a positive number"}), 400
 
-        db.session.add(idempotency_key_record)
-        db.session.commit()
-
-        return jsonify({"error": error_message, "transactionID": transaction_id}), 400
-
-    # Step 3: Record successful payment
-    # logging.debug("Creating payment record")
-    payment_record = Payment(
-        transactionID=transaction_id,
-        stripeID=stripe_response['id'],
-        amount=data['amount'],
-        currency=data['currency'],
-        chargeType="payment",
-        status=stripe_response.get('status', 'unknown'),
-        # idempotencyKey=data['idempotency_key']
-    )
-
-    idempotency_key_record = IdempotencyKey(
-        key=data['idempotency_key'],
-        response={
-            "transactionID": transaction_id,
-            "message": "Payment processed successfully",
-        },
-        created_at=datetime.utcnow()
-    )
+    # Replay the saved response if this key was used before; otherwise claim it
+    replay = idempotency.begin(data['idempotency_key'])
+    if replay is not None:
+        body, status_code = replay
+        return jsonify(body), status_code
 
     try:
-        # logging.debug("Adding payment record to the session")
+        # Generate transactionID
+        transaction_id = generate_transaction_id()
+
+        # convert amount to cents
+        amount_cents = int(data['amount'] * 100)
+
+        # Step 1: Create the charge via Stripe
+        stripe_response = create_charge(
+            amount=amount_cents,
+            currency=data['currency'],
+            source=data['source'],
+            chargeType="payment",
+            idempotencyKey=data['idempotency_key']
+        )
+
+        # Step 2: Handle failure. A decline is saved so a retry gets the same
+        # answer; any other error releases the key so the retry reaches Stripe.
+        if "error" in stripe_response:
+            error_message = stripe_response["error"]
+            body = {"error": error_message, "transactionID": transaction_id}
+            if stripe_response.get("declined"):
+                idempotency.finish(data['idempotency_key'], body, 400)
+            else:
+                idempotency.abandon(data['idempotency_key'])
+            return jsonify(body), 400
+
+        # Step 3: Record successful payment, committed together with its saved response
+        # logging.debug("Creating payment record")
+        payment_record = Payment(
+            transactionID=transaction_id,
+            stripeID=stripe_response['id'],
+            amount=data['amount'],
+            currency=data['currency'],
+            chargeType="payment",
+            status=stripe_response.get('status', 'unknown'),
+            # idempotencyKey=data['idempotency_key']
+        )
         db.session.add(payment_record)
-        # logging.debug("Committing the session")
-        db.session.flush()
-        db.session.commit()
-        # logging.debug("Payment record committed successfully")
-        db.session.add(idempotency_key_record)
-        db.session.commit()
+
+        body = {
+            "transactionID": transaction_id,
+            "stripeID": stripe_response['id'],
+            "amount": data['amount'],
+            "currency": data['currency'],
+            "chargeType": "payment",
+            "status": stripe_response.get('status', 'unknown'),
+            "idempotencyKey": data['idempotency_key']
+        }
+        idempotency.finish(data['idempotency_key'], body, 200)
     except Exception as e:
         # logging.error("Error during commit: %s", e)
-        db.session.rollback()  # Rollback the session to avoid invalid state
+        idempotency.abandon(data['idempotency_key'])  # Rolls back and lets a retry through
         return jsonify({"error": str(e)}), 500
 
-    return jsonify({
-        "transactionID": transaction_id,
-        "stripeID": stripe_response['id'],
-        "amount": data['amount'],
-        "currency": data['currency'],
-        "chargeType": "payment",
-        "status": stripe_response.get('status', 'unknown'),
-        "idempotencyKey": data['idempotency_key']
-    }), 200 # not sure if want to change to 201, but might need to change in buy_ticket composite service also
+    return jsonify(body), 200 # not sure if want to change to 201, but might need to change in buy_ticket composite service also
 
 @app.route('/payment/<transactionID>', methods=['GET'])
 def get_payment(transactionID):
@@ -171,68 +204,86 @@ def process_refund():
     """
     data = request.get_json()
     
-    if 'stripeID' not in data and 'idempotency_key' not in data:
+    if 'stripeID' not in data or 'idempotency_key' not in data:
         return jsonify({"error": "Missing stripeID or idempotency_key"}), 400
 
     # Generate or use provided idempotency key for refund
     # idempotencyKey = str(uuid.uuid4())
 
-    # Retrieve the original payment record from the database
-    original_payment = Payment.query.filter_by(stripeID=data['stripeID']).first()
-    if not original_payment:
-        return jsonify({"error": "Original payment not found"}), 404
-    
-    # The amount can be omitted for full refunds; adjust logic accordingly.
-    refund_response = refund_charge(
-        stripeID=data['stripeID'],
-        idempotencyKey=data['idempotency_key']
-    )
-
-    if "error" in refund_response:
-        return jsonify(refund_response), 400
-
-    # Generate transactionID
-    transaction_id = generate_transaction_id()
-
-    # Store the transaction in the database using the Payment model
-    payment_record = Payment(
-        transactionID=transaction_id,
-        stripeID=data['stripeID'],
-        amount=original_payment.amount,
-        currency=original_payment.currency,
-        chargeType="refund",
-        status=refund_response.get('status', 'unknown'),
-        # idempotencyKey=data['idempotency_key']
-    )
-
-    idempotency_key_record = IdempotencyKey(
-        key=data['idempotency_key'],
-        response={
-            "transactionID": transaction_id,
-            "message": "Refund processed successfully",
-        },
-        created_at=datetime.utcnow()
-    )
+    # Replay the saved response if this key was used before; otherwise claim it
+    replay = idempotency.begin(data['idempotency_key'])
+    if replay is not None:
+        body, status_code = replay
+        return jsonify(body), status_code
 
-    db.session.add(payment_record)
-    db.session.commit()
+    try:
+        # Retrieve the original payment record from the database
+        original_payment = Payment.query.filter_by(stripeID=data['stripeID']).first()
+        if not original_payment:
+            idempotency.abandon(data['idempotency_key'])
+            return jsonify({"error": "Original payment not found"}), 404
+        
+        # The amount can be omitted for full refunds; adjust logic accordingly.
+        refund_response = refund_charge(
+            stripeID=data['stripeID'],
+            idempotencyKey=data['idempotency_key']
+        )
 
-    db.session.add(idempotency_key_record)
-    db.session.commit()
+        if "error" in refund_response:
+            idempotency.abandon(data['idempotency_key'])
+            return jsonify(refund_response), 400
+
+        # Generate transactionID
+        transaction_id = generate_transaction_id()
+
+        # Store the transaction in the database using the Payment model,
+        # committed together with its saved response
+        payment_record = Payment(
+            transactionID=transaction_id,
+            stripeID=data['stripeID'],
+            amount=original_payment.amount,
+            currency=original_payment.currency,
+            chargeType="refund",
+            status=refund_response.get('status', 'unknown'),
+            # idempotencyKey=data['idempotency_key']
+        )
+        db.session.add(payment_record)
 
-    return jsonify({
-        "transactionID": transaction_id,
-        "stripeID": data['stripeID'],
-        "amount": original_payment.amount,
-        "currency": original_payment.currency,
-        "chargeType": "refund",  
-        "status": refund_response.get('status', 'unknown'),
-        "idempotencyKey": data['idempotency_key']
-    }), 201
+        body = {
+            "transactionID": transaction_id,
+            "stripeID": data['stripeID'],
+            # Numeric comes back as Decimal, which the JSON column can't store;
+            # str() matches how jsonify has always rendered it
+            "amount": str(original_payment.amount),
+            "currency": original_payment.currency,
+            "chargeType": "refund",  
+            "status": refund_response.get('status', 'unknown'),
+            "idempotencyKey": data['idempotency_key']
+        }
+        idempotency.finish(data['idempotency_key'], body, 201)
+    except Exception as e:
+        idempotency.abandon(data['idempotency_key'])
+        return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
+    return jsonify(body), 201
+
+# Run once before the service starts serving
+def init_db():
     with app.app_context():
         # logging.debug("creating database tables")
         db.create_all() 
         # logging.debug("database tables created successfully")
+        # create_all() skips tables that already exist, so add newer indexes to them
+        for index in IdempotencyKey.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Run in each server worker forked from a process that already imported the
+# app, so workers don't share the parent's pooled connections
+def after_fork():
+    with app.app_context():
+        db.engine.dispose(close=False)
+    idempotency_compaction.after_fork()
+
+if __name__ == '__main__':
+    init_db()
     app.run(debug=True, host="0.0.0.0", port=5001)
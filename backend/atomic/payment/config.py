@@ -3,6 +3,9 @@ import os
 
 from dotenv import load_dotenv, find_dotenv
 
+# Shared with the other services from backend/common, which is on PYTHONPATH
+from pool_stats import engine_options
+
 # load_dotenv(dotenv_path='backend/atomic/payment/.env') # This loads variables from a .env file into os.environ
 load_dotenv(find_dotenv())
 
@@ -15,3 +18,5 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('PAYMENT_DB_URL')
     SQLALCHEMY_ECHO = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool sizing from DB_POOL_* (see backend/common/pool_stats.py)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from db import db
+from models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Response column of a key whose request is still being processed
+IN_FLIGHT = {"inFlight": True}
+
+IN_PROGRESS_RESPONSE = ({"error": "A request with this idempotency key is still being processed"}, 409)
+
+
+def stored_response(response):
+    """(body, status code) saved for a finished request."""
+    if "statusCode" in response:
+        return response["body"], response["statusCode"]
+    # Rows written before whole responses were stored only kept a summary
+    status = 400 if "failed" in response.get("message", "") else 200
+    return response, status
+
+
+class IdempotencyGuard:
+    """
+    Lets each idempotency key through to Stripe once and replays the saved
+    response to every later request with the same key.
+
+    Finished responses are kept in an in-process LRU of `max_entries` in
+    front of the idempotency_keys table, so a retry costs a dictionary lookup.
+    A request that gets past both claims its key before doing any work: in
+    this process with an Event that concurrent duplicates wait on, and across
+    workers and replicas by inserting the key's row marked IN_FLIGHT, which
+    the primary key lets only one caller do. Duplicates wait up to
+    `wait_timeout` seconds for the owner to finish, then get a 409. A marker
+    older than `stale_after` seconds belongs to a request that died and may
+    be taken over; Stripe's own idempotency keys keep that retry safe.
+    Cached responses are dropped after `max_age` seconds, in step with the
+    rows the compaction job removes.
+    """
+
+    def __init__(self, max_entries=10000, wait_timeout=10, stale_after=60, poll_interval=0.2, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.wait_timeout = wait_timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._finished = OrderedDict()  # key -> (cached at, (body, status code))
+        self._in_flight = {}  # key -> Event set when its owner is done
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """
+        Returns (body, status code) to answer with when the key was already
+        used, or None when the caller now owns it and must end with finish()
+        or abandon().
+        """
+        cached = self._cached(key)
+        if cached:
+            return cached
+
+        with self._lock:
+            event = self._in_flight.get(key)
+            if event is None:
+                self._in_flight[key] = threading.Event()
+        if event is not None:
+            # Same key already being handled in this process
+            event.wait(self.wait_timeout)
+            return self._cached(key) or IN_PROGRESS_RESPONSE
+
+        try:
+            replay = self._claim(key)
+        except Exception:
+            self._release(key)
+            raise
+        if replay is not None:
+            self._release(key)
+        return replay
+
+    def finish(self, key, body, status_code):
+        """Save the owner's response, committing it together with whatever
+        else is pending in the session (e.g. the payment record)."""
+        try:
+            db.session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(response={"statusCode": status_code, "body": body})
+            )
+            db.session.commit()
+            self._remember(key, (body, status_code))
+        finally:
+            self._release(key)
+
+    def abandon(self, key):
+        """Give up a claimed key, e.g. after an error, so a retry can run."""
+        try:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to release idempotency key {key}: {str(e)}")
+        finally:
+            self._release(key)
+
+    def _claim(self, key):
+        db.session.add(IdempotencyKey(key=key, response=IN_FLIGHT, created_at=datetime.utcnow()))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        # The key has a row already: replay it, or wait for the worker that owns it
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            row = db.session.execute(
+                select(IdempotencyKey.response, IdempotencyKey.created_at).where(IdempotencyKey.key == key)
+            ).first()
+            db.session.rollback()  # don't hold a snapshot between polls
+
+            if row is None:
+                # The owner abandoned it; try again
+                return self._claim(key)
+            if row.response != IN_FLIGHT:
+                replay = stored_response(row.response)
+                self._remember(key, replay)
+                return replay
+            if row.created_at < datetime.utcnow() - timedelta(seconds=self.stale_after) and self._take_over(key, row.created_at):
+                return None
+            if time.monotonic() >= deadline:
+                return IN_PROGRESS_RESPONSE
+            time.sleep(self.poll_interval)
+
+    def _take_over(self, key, created_at):
+        # Only one of several callers finding the same stale marker wins
+        result = db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.created_at == created_at)
+            .values(created_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._finished.get(key)
+            if entry is None:
+                return None
+            if self.max_age is not None and entry[0] <= time.monotonic() - self.max_age:
+                del self._finished[key]
+                return None
+            self._finished.move_to_end(key)
+            return entry[1]
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._finished[key] = (time.monotonic(), response)
+            self._finished.move_to_end(key)
+            while len(self._finished) > self.max_entries:
+                self._finished.popitem(last=False)
+
+    def _release(self, key):
+        with self._lock:
+            event = self._in_flight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+def compact_idempotency_keys(cutoff, batch_size=1000):
+    """
+    Delete idempotency keys created before cutoff, oldest first, one batch of
+    at most batch_size rows per transaction so locks and WAL stay small.
+    Each batch is found through the created_at index. Returns rows removed.
+    """
+    removed = 0
+    while True:
+        keys = db.session.execute(
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.created_at < cutoff)
+            .order_by(IdempotencyKey.created_at)
+            .limit(batch_size)
+        ).scalars().all()
+        if not keys:
+            return removed
+
+        # created_at is checked again in case a stale marker was taken over meanwhile
+        result = db.session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.key.in_(keys), IdempotencyKey.created_at < cutoff)
+        )
+        db.session.commit()
+        removed += result.rowcount
+        if len(keys) < batch_size:
+            return removed
+
+
+@contextmanager
+def advisory_lock(engine, lock_id):
+    """
+    Yields whether this process got PostgreSQL advisory lock lock_id, held
+    until the block ends. Every worker of every replica shares the database,
+    so only one of them gets it at a time. Other databases (SQLite for local
+    runs) have no such locks, and the block always runs.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    with engine.connect() as conn:
+        acquired = conn.execute(select(func.pg_try_advisory_lock(lock_id))).scalar()
+        conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(select(func.pg_advisory_unlock(lock_id)))
+                conn.commit()
+
+
+class PeriodicJob:
+    """Calls `run` every `interval` seconds on a daemon thread. Failures are
+    printed and the job carries on at the next interval."""
+
+    def __init__(self, run, interval, name="periodic-job"):
+        self.run = run
+        self.interval = interval
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def after_fork(self):
+        # Threads don't survive a fork, so a forked worker starts its own
+        if self._thread is not None:
+            self._stop = threading.Event()
+            self._thread = None
+            self.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception as e:
+                print(f"{self.name} failed: {str(e)}")
@@ -1,7 +1,7 @@
 # models.py
 from db import db
 from sqlalchemy import Numeric, Integer, String, Text, JSON, DateTime
-from datetime import datetime, timedelta
+from datetime import datetime
 # import random
 
 # def generate_transaction_id():
@@ -11,10 +11,6 @@ from datetime import datetime, timedelta
 #             return new_id
 
 
-def get_singapore_time():
-    return datetime.utcnow() + timedelta(hours=8)
-
-
 class Payment(db.Model):
     __tablename__ = 'transactions'
     # transactionID = db.Column(db.String(20), primary_key=True, default=generate_transaction_id)
@@ -31,7 +27,15 @@ class IdempotencyKey(db.Model):
 
     key = db.Column(Text, primary_key=True)  # Now this is the primary key
     response = db.Column(JSON, nullable=False)  # Stores the response in JSON format
-    created_at = db.Column(DateTime, default=get_singapore_time, nullable=False)
+    # Naive UTC, the clock the idempotency guard and the compaction job compare
+    # against. Rows written before that used Singapore time (UTC+8), so they are
+    # kept up to 8 hours past IDEMPOTENCY_RETENTION_HOURS and then removed as usual.
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Lets the compaction job find expired keys oldest first without a table scan
+    __table_args__ = (
+        db.Index("ix_idempotency_keys_created_at", created_at),
+    )
 
     def __repr__(self):
         return f'<IdempotencyKey {self.key}>'
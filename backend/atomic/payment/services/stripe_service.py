@@ -27,7 +27,9 @@ def create_charge(amount, currency, source, chargeType, idempotencyKey=None):
         )
         return charge
     except stripe.error.StripeError as e:
-        return {"error": str(e)}
+        # Only a CardError is Stripe's final answer for this charge; network,
+        # rate limit and API errors may succeed when retried
+        return {"error": str(e), "declined": isinstance(e, stripe.error.CardError)}
 
 def refund_charge(stripeID, amount=None, idempotencyKey=None):
     """
@@ -0,0 +1,93 @@
+import os
+import socket
+import threading
+import time
+import zlib
+
+# Crockford base32: digits then letters without I, L, O and U, in ASCII order,
+# so fixed-width encodings sort the same way as the numbers they encode
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+
+TIMESTAMP_BITS = 42  # milliseconds since EPOCH_MS, good for ~139 years
+NODE_BITS = 8
+PID_BITS = 22  # Linux pid_max is at most 2^22
+SEQUENCE_BITS = 8
+
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ENCODED_LENGTH = 16  # 80 bits at 5 bits per character
+
+
+def encode(value, length=ENCODED_LENGTH):
+    chars = []
+    for _ in range(length):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def node_id_from_env():
+    """
+    TRANSACTION_NODE_ID if set. Otherwise one derived from the hostname, which
+    Docker sets to the container ID, so replicas started without the variable
+    still get different node IDs unless their hostnames happen to collide
+    (about 1 in 256 per pair); set it explicitly to rule that out.
+    """
+    node_id = os.getenv("TRANSACTION_NODE_ID")
+    if node_id is not None:
+        return int(node_id)
+    return zlib.crc32(socket.gethostname().encode()) & MAX_NODE_ID
+
+
+class TransactionIdGenerator:
+    """
+    Snowflake-style transaction IDs that need no database lookups.
+
+    Each ID packs milliseconds since EPOCH_MS, a node ID (one per replica of
+    the service), the process ID (one per worker on a replica) and a
+    per-millisecond sequence into 80 bits, written as 16 base32 characters
+    after the prefix: "txn-" + 16 = 20 characters, the width of
+    Payment.transactionID. IDs are unique as long as no two replicas share a
+    node ID, and sort in creation order, so new rows land at the end of the
+    primary key index.
+
+    If the clock steps backwards the generator keeps counting from the last
+    timestamp it used instead, so IDs from one process never go backwards.
+    """
+
+    def __init__(self, node_id=0, prefix="txn-"):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"node_id must be between 0 and {MAX_NODE_ID}")
+        self.node_id = node_id
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def __call__(self):
+        with self._lock:
+            pid = os.getpid()
+            if pid != self._pid:
+                # A forked worker starts its own sequence under its own pid
+                self._pid = pid
+                self._last_ms = -1
+
+            now_ms = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Sequence used up for this millisecond: move on to the next one
+                    now_ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+
+            value = now_ms
+            value = (value << NODE_BITS) | self.node_id
+            value = (value << PID_BITS) | (pid & ((1 << PID_BITS) - 1))
+            value = (value << SEQUENCE_BITS) | self._sequence
+            return self.prefix + encode(value)
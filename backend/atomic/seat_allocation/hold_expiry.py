@@ -0,0 +1,85 @@
+import heapq
+import threading
+import time
+
+
+class HoldExpiryScheduler:
+    """
+    Releases seat holds once they lapse.
+
+    Holds are kept in a min-heap ordered by expiry time, so the worker thread
+    only ever looks at the earliest deadline and sleeps until then. Confirming
+    or releasing a seat just forgets its deadline; the stale heap entry is
+    skipped when it reaches the top. Due seats are handed to `on_expire` in
+    batches of at most `batch_size`; if that fails they are retried after
+    `retry_delay` seconds.
+    """
+
+    def __init__(self, on_expire, batch_size=100, retry_delay=30, name="hold-expiry"):
+        self.on_expire = on_expire
+        self.name = name
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self._heap = []  # (expires_at, seat_id)
+        self._deadlines = {}  # seat_id -> expires_at of its live hold
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def after_fork(self):
+        """
+        Restart the worker thread in a forked child. Threads don't survive a
+        fork and the parent's lock may have been held at the time, so the
+        child gets a fresh condition and thread but keeps the tracked holds.
+        """
+        self._condition = threading.Condition()
+        self._thread = None
+        self.start()
+
+    def schedule(self, seat_ids, expires_at):
+        """Track holds on seat_ids that lapse at expires_at (epoch seconds)."""
+        with self._condition:
+            for seat_id in seat_ids:
+                self._deadlines[seat_id] = expires_at
+                heapq.heappush(self._heap, (expires_at, seat_id))
+            self._condition.notify()
+
+    def cancel(self, seat_ids):
+        """Stop tracking holds that were confirmed or released."""
+        with self._condition:
+            for seat_id in seat_ids:
+                self._deadlines.pop(seat_id, None)
+
+    def pending(self):
+        with self._condition:
+            return len(self._deadlines)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            expires_at, seat_id = heapq.heappop(self._heap)
+            # Skip entries for holds that were cancelled or re-scheduled
+            if self._deadlines.get(seat_id) == expires_at:
+                del self._deadlines[seat_id]
+                due.append(seat_id)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.time()
+                due = self._pop_due(now)
+                if not due:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._condition.wait(timeout)
+                    continue
+
+            try:
+                self.on_expire(due)
+            except Exception as e:
+                print(f"{self.name} failed for seats {due}: {str(e)}")
+                self.schedule(due, time.time() + self.retry_delay)
@@ -1,127 +1,488 @@
 from flask_cors import CORS
-from flask import Flask, request, jsonify
-from supabase import create_client
+from flask import Flask, Response, request, jsonify
 import os
-from datetime import datetime, timedelta
+import json
+import time
+import uuid
+import requests
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv, find_dotenv
+from seat_index import SeatIndex, parse_seat_id
+from hold_expiry import HoldExpiryScheduler
+from seat_events import SeatEventFeed
+from storage import create_seat_store
 
 # Initialize Flask App
 app = Flask(__name__)
 CORS(app)
-# Supabase Configuration
+# Storage Configuration (Supabase by default, or a pooled SQL database)
 load_dotenv(find_dotenv())
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-print(f"SUPABASE_URL: {SUPABASE_URL}")
+store = create_seat_store()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+TICKET_SERVICE_URL = "http://ticket_service:5005"
+TICKET_SERVICE_TIMEOUT = 10  # seconds
+
+# How long a reserved seat is held before it goes back on sale. Slightly longer
+# than the checkout page's 5 minute timer so a client-driven timeout wins.
+SEAT_HOLD_SECONDS = int(os.getenv("SEAT_HOLD_SECONDS", "360"))
+
+# Recent seat changes per event, streamed to event pages
+seat_event_feed = SeatEventFeed(history=int(os.getenv("SEAT_STREAM_HISTORY", "1000")))
+
+# Seconds between keep-alive comments on an idle seat change stream
+SEAT_STREAM_HEARTBEAT_SECONDS = int(os.getenv("SEAT_STREAM_HEARTBEAT_SECONDS", "15"))
+
+# In-memory availability index, kept current by this service's own writes
+seat_index = SeatIndex(
+    store.fetch_seat_rows,
+    ttl=int(os.getenv("SEAT_INDEX_TTL", "30")),
+    on_change=seat_event_feed.publish
+)
+
+try:
+    print(f"Seat index warmed with {seat_index.warm()} seats")
+except Exception as e:
+    # Events are loaded lazily on first read if warming fails
+    print(f"Failed to warm seat index: {str(e)}")
+
+# Puts lapsed holds back on sale and voids the pending tickets created for them.
+# The update only matches seats that are still reserved with an expired hold,
+# so a seat confirmed or re-reserved in the meantime is left alone.
+def expire_holds(seat_ids):
+    expired = store.expire_holds(seat_ids, datetime.now(timezone.utc))
+    if not expired:
+        return
+
+    seat_index.apply(expired, "available")
+    print(f"Released {len(expired)} expired seat hold(s)")
+
+    # The seats are committed as available now, so a retry of expire_holds
+    # would find nothing to void; the void is retried on its own instead
+    pending_voids.schedule(expired, time.time())
+
+# Voids the pending tickets created for released seats, so a stale checkout
+# can't pay for a seat that may already be held by someone else. Raising
+# keeps the seats queued for another try after VOID_RETRY_SECONDS.
+def void_pending_tickets(seat_ids):
+    void_response = requests.put(
+        f"{TICKET_SERVICE_URL}/tickets/void/pending-seats",
+        json={"seat_ids": seat_ids},
+        timeout=TICKET_SERVICE_TIMEOUT
+    )
+    if void_response.status_code != 200:
+        raise RuntimeError(f"ticket service answered {void_response.status_code}: {void_response.text}")
+
+hold_scheduler = HoldExpiryScheduler(expire_holds)
+pending_voids = HoldExpiryScheduler(
+    void_pending_tickets,
+    retry_delay=int(os.getenv("VOID_RETRY_SECONDS", "10")),
+    name="pending-ticket-void"
+)
+
+# Re-schedules holds that already exist in the table, e.g. after a restart.
+# Only reserved rows are read; holds without an expiry get a fresh one.
+def load_existing_holds():
+    default_expiry = datetime.now(timezone.utc) + timedelta(seconds=SEAT_HOLD_SECONDS)
+    for seat_id, reserved_until in store.reserved_holds(default_expiry):
+        hold_scheduler.schedule([seat_id], reserved_until.timestamp())
+
+try:
+    load_existing_holds()
+    print(f"Tracking {hold_scheduler.pending()} existing seat hold(s)")
+except Exception as e:
+    print(f"Failed to load existing seat holds: {str(e)}")
+
+hold_scheduler.start()
+pending_voids.start()
+
+# Bookkeeping after seats successfully moved to a new status: keeps the seat
+# index current and starts or stops tracking hold expiry
+def record_transition(seat_ids, status, hold_expires_at=None):
+    seat_index.apply(seat_ids, status)
+    if hold_expires_at is not None:
+        hold_scheduler.schedule(seat_ids, hold_expires_at.timestamp())
+    else:
+        hold_scheduler.cancel(seat_ids)
+
+def new_hold_expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=SEAT_HOLD_SECONDS)
 
 
 @app.route("/")
 def sayhello():
     return "Hello from seat allocation",200
 
+# ETags combine this process's start-up ID with the event's version, so a
+# version number seen before a restart can never be mistaken for a current one
+INSTANCE_ID = uuid.uuid4().hex[:8]
+
+def event_etag(event_id):
+    return f"{INSTANCE_ID}-{event_id}-{seat_index.version(event_id)}"
+
+# Answers a conditional GET with 304 when the client already has this version,
+# otherwise builds the body and tags it. Clients are told to revalidate every time.
+def conditional_response(etag, build_body):
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Columns that can be requested from /availability with ?fields=
+AVAILABILITY_FIELDS = ("seatid", "eventid", "cat_no", "status", "section", "seat_no")
+
+def availability_row(event_id, seat_id, cat_no, fields):
+    row = {
+        "seatid": seat_id,
+        "eventid": event_id,
+        "cat_no": cat_no,
+        "status": "available"
+    }
+    if "section" in fields or "seat_no" in fields:
+        row["section"], row["seat_no"] = parse_seat_id(seat_id)
+    return {field: row[field] for field in fields}
+
 ###Get Available seats from an event
+# Optional query params:
+#   category - only seats with this cat_no (e.g. cat_1, vip)
+#   fields   - comma separated subset of AVAILABILITY_FIELDS
+#   limit    - maximum number of seats to return
+#   after    - keyset cursor: only seats with a seatid after this one
 @app.route("/availability/<event_id>", methods=["GET"])
 def get_seat_availability(event_id):
-    response = supabase.table("seat_allocation").select("*").eq("eventid", event_id).eq("status", "available").execute()
-    available_seats = response.data
-    return jsonify({"available_seats": available_seats}), 200
+    category = request.args.get("category")
+    after = request.args.get("after")
 
+    fields = request.args.get("fields")
+    if fields:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in AVAILABILITY_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {unknown}. Allowed fields: {list(AVAILABILITY_FIELDS)}"}), 400
+    else:
+        fields = ["seatid", "eventid", "cat_no", "status"]
 
-### Reserve a Seat
-@app.route("/reserve/<seat_id>", methods=["POST"])
-def reserve_seat(seat_id):
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = int(limit)
 
-    response = supabase.table("seat_allocation").select("*").eq("seatid", seat_id).execute()
-    
-    if not response.data:
-        return jsonify({"error": "Seat not found"}), 404
-    
-    seat = response.data[0]
+    # Read the version before the seats so the tag can only be older than the body
+    etag = event_etag(event_id)
 
-    if seat["status"] != "available":
-        return jsonify({"error": "Seat already reserved"}), 409
+    def build_body():
+        seats = seat_index.available_seats(event_id, category=category, after=after, limit=limit)
+        available_seats = [availability_row(event_id, seat_id, cat_no, fields) for seat_id, cat_no in seats]
 
-    update_response = supabase.table("seat_allocation").update({
-        "status": "reserved",
-    }).eq("seatid", seat_id).execute()
+        # A full page means there may be more seats after the last one returned
+        next_cursor = seats[-1][0] if limit and len(seats) == limit else None
+        return {"available_seats": available_seats, "next_cursor": next_cursor}
 
-    if update_response.data:
-        reservation_response = {
-            "message": "Seat reserved successfully",
-            "seatid": seat_id
-        }
+    return conditional_response(etag, build_body)
+
+
+# Per-category available/reserved/confirmed counts, read from the counters the
+# seat index maintains on every transition (no seat rows are touched)
+@app.route("/availability/<event_id>/summary", methods=["GET"])
+def get_availability_summary(event_id):
+    etag = event_etag(event_id)
+
+    def build_body():
+        categories = seat_index.counts(event_id)
+
+        totals = {}
+        for counts in categories.values():
+            for status, count in counts.items():
+                totals[status] = totals.get(status, 0) + count
+        return {"eventid": event_id, "categories": categories, "total": totals}
+
+    return conditional_response(etag, build_body)
+
+
+# Version a stream client wants to resume after: the Last-Event-ID header an
+# EventSource sends on reconnect, or ?since= for a client that kept the last
+# event id itself. Both are event ids ("<instance>-<version>") and only count
+# if this process issued them, since versions restart at 0 in every process.
+def resume_version(last_event_id, since):
+    event_id = last_event_id or since
+    if not event_id:
+        return None
+    instance, _, version = event_id.rpartition("-")
+    if instance == INSTANCE_ID and version.isdigit():
+        return int(version)
+    return None
+
+def sse_message(version, event, data):
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {INSTANCE_ID}-{version}\nevent: {event}\ndata: {payload}\n\n"
+
+### Stream seat changes of an event as Server-Sent Events
+# "delta" events carry the seats that moved to one status and the event version
+# after the move, e.g. {"version":42,"status":"reserved","seat_ids":["E04_F06_cat_1"]}.
+# A "reset" event means the client should refetch /availability (or its summary)
+# and from then on only apply deltas with a higher version. One is sent first
+# unless the client resumes from a version that is still in the kept history.
+@app.route("/availability/<event_id>/stream", methods=["GET"])
+def stream_seat_changes(event_id):
+    since = resume_version(request.headers.get("Last-Event-ID"), request.args.get("since"))
+    if since is not None and since > seat_index.version(event_id):
+        since = None
+
+    def generate():
+        version = since
+        while True:
+            if version is None:
+                version = seat_index.version(event_id)
+                yield sse_message(version, "reset", {"version": version})
+
+            deltas = seat_event_feed.wait(event_id, version, SEAT_STREAM_HEARTBEAT_SECONDS)
+            if not deltas:
+                yield ": keep-alive\n\n"
+                continue
+
+            if deltas[0][0] != version + 1:
+                # The client fell further behind than the kept history
+                version = None
+                continue
+
+            for delta_version, status, seat_ids in deltas:
+                if status is None:
+                    yield sse_message(delta_version, "reset", {"version": delta_version})
+                else:
+                    yield sse_message(delta_version, "delta", {
+                        "version": delta_version,
+                        "status": status,
+                        "seat_ids": seat_ids
+                    })
+                version = delta_version
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
-        return jsonify(reservation_response), 200
-    else:
-        return jsonify({"error": "Reservation failed"}), 500
+
+# Moves a single seat; a missing seat is a 404 and a seat in the wrong state a 409
+def single_transition(seat_id, from_statuses, to_status, conflict_message, reserved_until=None):
+    results, success = store.transition([seat_id], from_statuses, to_status, reserved_until)
+
+    if not success:
+        if results[0]["result"] == "not_found":
+            return jsonify({"error": "Seat not found"}), 404
+        return jsonify({"error": conflict_message}), 409
+
+    record_transition([seat_id], to_status, reserved_until)
+    return None
+
+### Reserve a Seat
+@app.route("/reserve/<seat_id>", methods=["POST"])
+def reserve_seat(seat_id):
+    # Conditional transition: only succeeds if the seat is still available,
+    # so two buyers racing for the same seat cannot both succeed
+    reserved_until = new_hold_expiry()
+    error_response = single_transition(seat_id, ["available"], "reserved", "Seat already reserved", reserved_until)
+    if error_response:
+        return error_response
+
+    reservation_response = {
+        "message": "Seat reserved successfully",
+        "seatid": seat_id,
+        "reserved_until": reserved_until.isoformat()
+    }
+
+    return jsonify(reservation_response), 200
 
 # Confirm seat change status from reserved to confirmed
 @app.route("/confirm/<seat_id>", methods=["PUT"])
 def confirm_seat(seat_id):
-    response = supabase.table("seat_allocation").select("*").eq("seatid", seat_id).execute()
-    
-    if not response.data:
-        return jsonify({"error": "Seat not found"}), 404
-    
-    seat = response.data[0]
-    
-    if seat["status"] != "reserved":
-        return jsonify({"error": "Seat is not reserved"}), 409
-
+    error_response = single_transition(seat_id, ["reserved"], "confirmed", "Seat is not reserved")
+    if error_response:
+        return error_response
 
-    update_response = supabase.table("seat_allocation").update({
-        "status": "confirmed"
-    }).eq("seatid", seat_id).execute()
-    
     return jsonify({"message": "Seat confirmed"}), 200
 
 
 # change seat status to available
 @app.route("/release/<seat_id>", methods=["PUT"])
 def release_seat(seat_id):
-    response = supabase.table("seat_allocation").select("*").eq("seatid", seat_id).execute()
-    
-    if not response.data:
-        return jsonify({"error": "Seat not found"}), 404
+    error_response = single_transition(seat_id, ["reserved", "confirmed"], "available", "Seat is not reserved")
+    if error_response:
+        return error_response
 
-    seat = response.data[0]
+    return jsonify({"message": "Seat released successfully"}), 200
 
-    if seat["status"] not in ["reserved","confirmed"]:
-        return jsonify({"error": "Seat is not reserved"}), 409
+# How often best-available retries when the index turns out to be behind the
+# database (another process took some of the picked seats first)
+BEST_AVAILABLE_ATTEMPTS = 3
 
-    update_response = supabase.table("seat_allocation").update({
-        "status": "available"
-    }).eq("seatid", seat_id).execute()
+### Pick and reserve the best available seats in a category in one step
+# Expects {"quantity": n}; seats are side by side in one row when possible
+@app.route("/reserve/best-available/<event_id>/<category>", methods=["POST"])
+def reserve_best_available(event_id, category):
+    data = request.get_json(silent=True) or {}
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        quantity = 0
+
+    if quantity < 1:
+        return jsonify({"error": "quantity must be a positive integer"}), 400
+
+    for _ in range(BEST_AVAILABLE_ATTEMPTS):
+        seat_ids = seat_index.claim_best_available(event_id, category, quantity)
+        if seat_ids is None:
+            return jsonify({"error": f"Not enough seats available in {category}"}), 409
+
+        reserved_until = new_hold_expiry()
+        try:
+            results, success = store.transition(seat_ids, ["available"], "reserved", reserved_until)
+        except Exception:
+            # The database never changed: hand the claimed seats back, which
+            # also tells stream clients they are available again
+            seat_index.apply(seat_ids, "available")
+            raise
+        if success:
+            record_transition(seat_ids, "reserved", reserved_until)
+            return jsonify({
+                "message": "Seats reserved successfully",
+                "seat_ids": seat_ids,
+                "reserved_until": reserved_until.isoformat()
+            }), 200
+
+        seat_index.load_event(event_id)
+
+    return jsonify({"error": "Seats were taken while reserving, please try again"}), 409
+
+# Reads and de-duplicates the "seat_ids" list from a batch request body
+def get_batch_seat_ids():
+    data = request.get_json(silent=True) or {}
+    seat_ids = data.get("seat_ids")
+
+    if not isinstance(seat_ids, list) or not seat_ids:
+        return None
+    return list(dict.fromkeys(str(seat_id) for seat_id in seat_ids))
+
+# Moves every seat in seat_ids to to_status, or none of them
+def batch_response(seat_ids, from_statuses, to_status, message):
+    reserved_until = new_hold_expiry() if to_status == "reserved" else None
+    results, success = store.transition(seat_ids, from_statuses, to_status, reserved_until)
+
+    if not success:
+        return jsonify({"error": "One or more seats could not be updated", "results": results}), 409
+
+    record_transition(seat_ids, to_status, reserved_until)
+
+    response = {"message": message, "results": results}
+    if reserved_until:
+        response["reserved_until"] = reserved_until.isoformat()
+    return jsonify(response), 200
+
+### Reserve several seats, all or nothing
+@app.route("/reserve/batch", methods=["POST"])
+def reserve_seats():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    return batch_response(seat_ids, ["available"], "reserved", "Seats reserved successfully")
+
+# Confirm several reserved seats, all or nothing
+@app.route("/confirm/batch", methods=["PUT"])
+def confirm_seats():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    return batch_response(seat_ids, ["reserved"], "confirmed", "Seats confirmed")
+
+# Restart the hold on several reserved seats, all or nothing, e.g. before a
+# payment so the seats cannot lapse while the card is being charged
+@app.route("/extend/batch", methods=["PUT"])
+def extend_holds():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    return batch_response(seat_ids, ["reserved"], "reserved", "Seat holds extended")
+
+# Release several reserved or confirmed seats, all or nothing
+@app.route("/release/batch", methods=["PUT"])
+def release_seats():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    return batch_response(seat_ids, ["reserved", "confirmed"], "available", "Seats released successfully")
+
+# Release several seats that are still only reserved, all or nothing. For
+# abandoned checkouts: a seat paid for (confirmed) in the meantime fails the
+# whole call instead of going back on sale.
+@app.route("/release/reserved/batch", methods=["PUT"])
+def release_reserved_seats():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    return batch_response(seat_ids, ["reserved"], "available", "Seats released successfully")
 
-    return jsonify({"message": "Seat released successfully"}), 200
 # verify seat
 @app.route("/seat/validity/<seat_id>/<cat_no>", methods=["GET"])
 def verify_seat(seat_id, cat_no):
-    response = supabase.table("seat_allocation").select("*").eq("seatid", seat_id).execute()
+    seats = store.get_seats([seat_id])
     
-    if not response.data:
+    if not seats:
         return jsonify({"error": "Seat not found"}), 404
 
-    seat = response.data[0]
+    seat = seats[0]
 
     if str(seat["cat_no"]) == str(cat_no):
         return jsonify({"valid": True}), 200
     else:
         return jsonify({"valid": False}), 200
 
+# Get details for several seats in one query
+# Expects {"seat_ids": [...]}; seats that do not exist are listed in "not_found"
+@app.route("/seat/details/batch", methods=["POST"])
+def get_seat_details_batch():
+    seat_ids = get_batch_seat_ids()
+    if seat_ids is None:
+        return jsonify({"error": "Missing seat_ids list"}), 400
+
+    seats = {seat["seatid"]: seat for seat in store.get_seats(seat_ids)}
+
+    return jsonify({
+        "seats": seats,
+        "not_found": [seat_id for seat_id in seat_ids if seat_id not in seats]
+    }), 200
+
 # Get seat details by seat_id
 @app.route("/seat/details/<seat_id>", methods=["GET"])
 def get_seat_details(seat_id):
-    response = supabase.table("seat_allocation").select("*").eq("seatid", seat_id).execute()
+    seats = store.get_seats([seat_id])
     
-    if not response.data:
+    if not seats:
         return jsonify({"error": "Seat not found"}), 404
 
-    seat = response.data[0]
+    seat = seats[0]
     return jsonify(seat), 200
    
+# Run in each server worker forked from a process that already imported the
+# app: a worker needs its own database client, hold expiry thread and ETag
+# instance ID, and a seat index loaded fresh rather than copied from the parent
+def after_fork():
+    global INSTANCE_ID
+    store.reconnect()
+    hold_scheduler.after_fork()
+    pending_voids.after_fork()
+    INSTANCE_ID = uuid.uuid4().hex[:8]
+    try:
+        print(f"Seat index warmed with {seat_index.warm()} seats")
+    except Exception as e:
+        print(f"Failed to warm seat index: {str(e)}")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,83 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class FreeIntervals:
+    """
+    Free seats of one category, kept as maximal runs of adjacent seat numbers
+    per row (section).
+
+    Each row holds its runs as parallel sorted `starts`/`ends` lists, and all
+    runs of the category are also kept in `by_length`, sorted by
+    (length, section, start). Finding the smallest run that fits a group is a
+    bisect on `by_length`, O(log n) in the number of runs. Taking or freeing a
+    seat finds its run with a bisect, but updating the plain lists shifts
+    their tails: O(runs in the row) for the row and O(n) for `by_length`.
+    Those are memmoves of a few thousand entries at most for a venue, which
+    is cheaper in practice than a balanced tree in Python.
+    """
+
+    def __init__(self):
+        self.rows = {}  # section -> ([starts], [ends])
+        self.by_length = []
+
+    def _add_run(self, section, start, end):
+        starts, ends = self.rows.setdefault(section, ([], []))
+        i = bisect_left(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        insort(self.by_length, (end - start + 1, section, start))
+
+    def _remove_run(self, section, i):
+        starts, ends = self.rows[section]
+        start, end = starts.pop(i), ends.pop(i)
+        del self.by_length[bisect_left(self.by_length, (end - start + 1, section, start))]
+        return start, end
+
+    def free(self, section, seat_no):
+        """Mark a seat free, merging it with the runs on either side."""
+        starts, ends = self.rows.setdefault(section, ([], []))
+        i = bisect_right(starts, seat_no)
+        if i > 0 and ends[i - 1] >= seat_no:
+            return  # already free
+
+        start = end = seat_no
+        if i < len(starts) and starts[i] == seat_no + 1:
+            _, end = self._remove_run(section, i)
+        if i > 0 and ends[i - 1] == seat_no - 1:
+            start, _ = self._remove_run(section, i - 1)
+
+        self._add_run(section, start, end)
+
+    def take(self, section, seat_no):
+        """Mark a seat taken, splitting the run that contains it."""
+        if section not in self.rows:
+            return
+        starts, ends = self.rows[section]
+        i = bisect_right(starts, seat_no) - 1
+        if i < 0 or ends[i] < seat_no:
+            return  # already taken
+
+        start, end = self._remove_run(section, i)
+        if start < seat_no:
+            self._add_run(section, start, seat_no - 1)
+        if seat_no < end:
+            self._add_run(section, seat_no + 1, end)
+
+    def best_available(self, quantity):
+        """
+        (section, seat_no) pairs for `quantity` seats. Prefers the smallest run
+        that seats the whole group side by side; otherwise falls back to the
+        fewest, largest runs. Returns None if there are not enough free seats.
+        """
+        i = bisect_left(self.by_length, (quantity,))
+        if i < len(self.by_length):
+            _, section, start = self.by_length[i]
+            return [(section, start + offset) for offset in range(quantity)]
+
+        picked = []
+        for length, section, start in reversed(self.by_length):
+            take = min(length, quantity - len(picked))
+            picked.extend((section, start + offset) for offset in range(take))
+            if len(picked) == quantity:
+                return picked
+        return None
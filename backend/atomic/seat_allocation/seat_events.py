@@ -0,0 +1,43 @@
+import threading
+from collections import deque
+
+
+class SeatEventFeed:
+    """
+    Recent seat status changes per event, for streaming to event pages.
+
+    Every version bump of an event in the seat index is recorded here as a
+    delta (version, status, seat_ids), or as (version, None, None) when the
+    event was reloaded from the database and clients have to refetch it.
+    Only the last `history` deltas of each event are kept; a client that
+    wants to resume from an older version gets a reset instead.
+    """
+
+    def __init__(self, history=1000):
+        self.history = history
+        self._deltas = {}  # event_id -> deque of (version, status, seat_ids)
+        self._condition = threading.Condition()
+
+    def publish(self, event_id, version, status, seat_ids):
+        with self._condition:
+            if event_id not in self._deltas:
+                self._deltas[event_id] = deque(maxlen=self.history)
+            self._deltas[event_id].append((version, status, seat_ids))
+            self._condition.notify_all()
+
+    def since(self, event_id, version):
+        """Deltas of an event newer than version, oldest first."""
+        with self._condition:
+            return self._newer(event_id, version)
+
+    def wait(self, event_id, version, timeout):
+        """Like since(), but blocks up to timeout seconds until there is something newer."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._newer(event_id, version), timeout)
+            return self._newer(event_id, version)
+
+    def _newer(self, event_id, version):
+        deltas = self._deltas.get(event_id)
+        if not deltas or deltas[-1][0] <= version:
+            return []
+        return [delta for delta in deltas if delta[0] > version]
@@ -0,0 +1,321 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_right
+from itertools import islice, repeat
+from seat_allocator import FreeIntervals
+
+# Seat states are stored as one byte per seat, in these positions
+SEAT_STATES = ("available", "reserved", "confirmed")
+STATE_CODES = {state: code for code, state in enumerate(SEAT_STATES)}
+AVAILABLE = STATE_CODES["available"]
+
+# Seat IDs look like "E04_F06_cat_1" or "E03_A04_vip": event, section letter
+# and seat number within the section, then the category
+SEAT_ID_PATTERN = re.compile(r"^E(\d+)_([A-Za-z]+)(\d+)")
+
+
+def parse_seat_id(seat_id):
+    """Section and seat number encoded in a seat ID, or (None, None)."""
+    match = SEAT_ID_PATTERN.match(seat_id)
+    if not match:
+        return None, None
+    return match.group(2).upper(), int(match.group(3))
+
+
+class CategorySeats:
+    """
+    Seats of one category in one event, stored as parallel arrays.
+    Seats are added in seat ID order, so seat_ids is sorted. Available seats
+    are also tracked as runs of adjacent seats for best-available picks.
+    """
+
+    def __init__(self):
+        self.seat_ids = []
+        self.states = bytearray()
+        self.counts = [0] * len(SEAT_STATES)
+        self.seat_numbers = []  # position -> (section, seat_no)
+        self.seat_at = {}  # (section, seat_no) -> seat_id
+        self.intervals = FreeIntervals()
+
+    def add(self, seat_id, state_code):
+        position = len(self.seat_ids)
+        section, seat_no = parse_seat_id(seat_id)
+        if section is None:
+            # Seats whose ID does not follow the usual pattern are never
+            # adjacent to anything
+            section, seat_no = "", position * 2
+
+        self.seat_ids.append(seat_id)
+        self.states.append(state_code)
+        self.counts[state_code] += 1
+        self.seat_numbers.append((section, seat_no))
+        self.seat_at[(section, seat_no)] = seat_id
+        if state_code == AVAILABLE:
+            self.intervals.free(section, seat_no)
+        return position
+
+    def set_state(self, position, state_code):
+        old_code = self.states[position]
+        if old_code == state_code:
+            return False
+        self.states[position] = state_code
+        self.counts[old_code] -= 1
+        self.counts[state_code] += 1
+
+        section, seat_no = self.seat_numbers[position]
+        if state_code == AVAILABLE:
+            self.intervals.free(section, seat_no)
+        elif old_code == AVAILABLE:
+            self.intervals.take(section, seat_no)
+        return True
+
+    def seat_ids_in_state(self, state_code, after=None):
+        """Seat IDs in a state, in seat ID order, optionally only those after a given ID."""
+        start = bisect_right(self.seat_ids, after) if after is not None else 0
+        pairs = zip(islice(self.seat_ids, start, None), islice(self.states, start, None))
+        for seat_id, code in pairs:
+            if code == state_code:
+                yield seat_id
+
+
+class EventSeats:
+    """
+    All seats of one event, grouped by category. `version` increases every
+    time a seat of the event changes state.
+    """
+
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.categories = {}
+        self.loaded_at = time.monotonic()
+        self.version = 0
+
+    def same_seats(self, other):
+        """True if both snapshots hold the same seats in the same states."""
+        if self.categories.keys() != other.categories.keys():
+            return False
+        return all(
+            seats.seat_ids == other.categories[cat_no].seat_ids and seats.states == other.categories[cat_no].states
+            for cat_no, seats in self.categories.items()
+        )
+
+
+class SeatIndex:
+    """
+    In-memory per-event seat state index.
+
+    The index is filled from the database by `loader` (warmed for every event
+    at startup, or one event at a time on first use) and then kept current by
+    calling `apply` after each successful reserve/confirm/release. Entries are
+    reloaded once they are older than `ttl` seconds, which bounds how stale the
+    view can get when other processes write to the same table.
+
+    If given, `on_change(event_id, version, status, seat_ids)` is called under
+    the index lock for every version bump: with the seats that moved to
+    `status`, or with status and seat_ids None when a reload changed the event.
+
+    Rows are fetched outside the lock, so an `apply` can land while a load is
+    reading the database, and the fetched rows may predate that write. Loads
+    therefore note the writes seen before fetching and fetch again, up to
+    `load_attempts` times, if any arrived meanwhile; a load that still raced
+    is installed but marked for reloading on its next use.
+
+    Only one thread at a time reloads an event that passed its TTL; the others
+    keep serving the stale entry meanwhile, or wait for the load when the
+    event isn't in the index yet.
+    """
+
+    def __init__(self, loader, ttl=30, on_change=None, load_attempts=3):
+        self.loader = loader
+        self.ttl = ttl
+        self.on_change = on_change
+        self.load_attempts = load_attempts
+        self._events = {}
+        self._seat_location = {}  # seatid -> (event_id, cat_no, position)
+        self._writes = 0  # apply() calls so far
+        self._unplaced_writes = 0  # apply() calls naming seats not in the index
+        self._loading = {}  # event_id -> Event set when its reload finishes
+        self._lock = threading.RLock()
+
+    def _load(self, event_id, write_marker, install):
+        """
+        Fetch rows from the loader (outside the lock) and hand them, sorted by
+        seat ID, to install(rows, current) under the lock. `current` is False
+        when writes counted by write_marker() kept landing during the fetch.
+        """
+        for attempt in range(self.load_attempts):
+            with self._lock:
+                before = write_marker()
+            rows = sorted(self.loader(event_id), key=lambda row: row["seatid"])
+            with self._lock:
+                current = write_marker() == before
+                if current or attempt == self.load_attempts - 1:
+                    return install(rows, current)
+
+    def warm(self):
+        """Load every seat of every event."""
+        def install(rows, current):
+            self._events = {}
+            self._seat_location = {}
+            for row in rows:
+                event_id = str(row["eventid"])
+                if event_id not in self._events:
+                    self._events[event_id] = EventSeats(event_id)
+                self._add_seat(self._events[event_id], row)
+            if not current:
+                for event in self._events.values():
+                    event.loaded_at = float("-inf")
+            return len(rows)
+
+        return self._load(None, lambda: self._writes, install)
+
+    def load_event(self, event_id):
+        """(Re)load a single event from the database."""
+        event_id = str(event_id)
+
+        def write_marker():
+            # Writes to this event bump its version; writes to seats the index
+            # doesn't place yet (e.g. of an event not loaded before) are counted apart
+            event = self._events.get(event_id)
+            return (event.version if event else None, self._unplaced_writes)
+
+        def install(rows, current):
+            old_event = self._events.get(event_id)
+            if old_event:
+                for category in old_event.categories.values():
+                    for seat_id in category.seat_ids:
+                        self._seat_location.pop(seat_id, None)
+
+            event = EventSeats(event_id)
+            for row in rows:
+                self._add_seat(event, row)
+            if not current:
+                # May be missing a write: serve it, but reload on next use
+                event.loaded_at = float("-inf")
+
+            # Keep the version when a periodic reload finds nothing new, so
+            # clients holding it can keep using their cached copy
+            if old_event:
+                event.version = old_event.version if old_event.same_seats(event) else old_event.version + 1
+            self._events[event_id] = event
+            if old_event and event.version != old_event.version and self.on_change:
+                self.on_change(event_id, event.version, None, None)
+            return event
+
+        return self._load(event_id, write_marker, install)
+
+    def _add_seat(self, event, row):
+        cat_no = row["cat_no"]
+        state_code = STATE_CODES.get(row["status"])
+        if state_code is None:
+            return
+        category = event.categories.setdefault(cat_no, CategorySeats())
+        position = category.add(row["seatid"], state_code)
+        self._seat_location[row["seatid"]] = (event.event_id, cat_no, position)
+
+    def _get_event(self, event_id):
+        event_id = str(event_id)
+        while True:
+            with self._lock:
+                event = self._events.get(event_id)
+                if event and time.monotonic() - event.loaded_at < self.ttl:
+                    return event
+                loading = self._loading.get(event_id)
+                if loading is None:
+                    self._loading[event_id] = threading.Event()
+                    break
+                if event:
+                    # Another thread is reloading it
+                    return event
+            # Nothing to serve until the first load finishes (or fails, in
+            # which case this thread tries itself)
+            loading.wait()
+
+        try:
+            return self.load_event(event_id)
+        finally:
+            with self._lock:
+                self._loading.pop(event_id).set()
+
+    def apply(self, seat_ids, status):
+        """Record that seat_ids moved to status. Returns the affected event IDs."""
+        state_code = STATE_CODES[status]
+        changed_events = {}  # event_id -> seat IDs whose state changed
+        with self._lock:
+            self._writes += 1
+            unplaced = False
+            for seat_id in seat_ids:
+                location = self._seat_location.get(seat_id)
+                event = self._events.get(location[0]) if location else None
+                if event is None:
+                    unplaced = True
+                    continue
+                event_id, cat_no, position = location
+                if event.categories[cat_no].set_state(position, state_code):
+                    changed_events.setdefault(event_id, []).append(seat_id)
+            if unplaced:
+                self._unplaced_writes += 1
+            for event_id, changed_seat_ids in changed_events.items():
+                event = self._events[event_id]
+                event.version += 1
+                if self.on_change:
+                    self.on_change(event_id, event.version, status, changed_seat_ids)
+        return set(changed_events)
+
+    def version(self, event_id):
+        """Current version of an event's seat states."""
+        return self._get_event(event_id).version
+
+    def available_seats(self, event_id, category=None, after=None, limit=None):
+        """
+        Available seats of an event as (seatid, cat_no) pairs in seat ID order.
+        Optionally restricted to one category, to seats after the `after` seat
+        ID (keyset cursor), and to at most `limit` seats.
+        """
+        event = self._get_event(event_id)
+        available_code = STATE_CODES["available"]
+        with self._lock:
+            if category is None:
+                categories = event.categories.items()
+            elif category in event.categories:
+                categories = [(category, event.categories[category])]
+            else:
+                categories = []
+
+            per_category = [
+                zip(seats.seat_ids_in_state(available_code, after), repeat(cat_no))
+                for cat_no, seats in categories
+            ]
+            return list(islice(heapq.merge(*per_category), limit))
+
+    def claim_best_available(self, event_id, category, quantity):
+        """
+        Picks `quantity` available seats in a category, side by side where
+        possible, and marks them reserved in the index so concurrent callers
+        in this process cannot pick them too. Returns the seat IDs, or None if
+        the category does not have enough available seats. A caller that then
+        fails to reserve them must apply "available" (or reload the event).
+        """
+        event = self._get_event(event_id)
+        with self._lock:
+            seats = event.categories.get(category)
+            if seats is None:
+                return None
+            picked = seats.intervals.best_available(quantity)
+            if picked is None:
+                return None
+
+            seat_ids = [seats.seat_at[seat] for seat in picked]
+            self.apply(seat_ids, "reserved")
+            return seat_ids
+
+    def counts(self, event_id):
+        """Per-category seat counts by state, e.g. {"cat_1": {"available": 10, ...}}."""
+        event = self._get_event(event_id)
+        with self._lock:
+            return {
+                cat_no: dict(zip(SEAT_STATES, seats.counts))
+                for cat_no, seats in event.categories.items()
+            }
@@ -0,0 +1,268 @@
+import os
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, MetaData, Table, Column, String, DateTime, select, update
+
+
+def failed_results(seat_ids, moved, existing):
+    """Per-seat results for a batch that was not applied."""
+    results = []
+    for seat_id in seat_ids:
+        if seat_id in moved:
+            result = "rolled_back"
+        elif seat_id in existing:
+            result = "conflict"
+        else:
+            result = "not_found"
+        results.append({"seatid": seat_id, "result": result})
+    return results
+
+
+class SupabaseSeatStore:
+    """Seat storage through the Supabase (PostgREST) client. No transactions,
+    so all-or-nothing batches are emulated with compensating updates."""
+
+    # PostgREST caps how many rows a single select returns, so large venues
+    # are read page by page
+    PAGE_SIZE = 1000
+
+    def __init__(self, url, key):
+        self.url = url
+        self.key = key
+        self.client = self._create_client()
+
+    def _create_client(self):
+        # Imported here so the SQL store can run without supabase installed
+        from supabase import create_client
+        return create_client(self.url, self.key)
+
+    def reconnect(self):
+        self.client = self._create_client()
+
+    def _table(self):
+        return self.client.table("seat_allocation")
+
+    def _select_pages(self, build_query):
+        rows = []
+        start = 0
+        while True:
+            page = build_query().order("seatid").range(start, start + self.PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < self.PAGE_SIZE:
+                return rows
+            start += self.PAGE_SIZE
+
+    def fetch_seat_rows(self, event_id=None):
+        def build_query():
+            query = self._table().select("seatid, eventid, cat_no, status")
+            if event_id is not None:
+                query = query.eq("eventid", event_id)
+            return query
+        return self._select_pages(build_query)
+
+    def get_seats(self, seat_ids):
+        return self._table().select("*").in_("seatid", seat_ids).execute().data
+
+    def transition(self, seat_ids, from_statuses, to_status, reserved_until=None):
+        changes = {"status": to_status}
+        if reserved_until is not None:
+            changes["reserved_until"] = reserved_until.isoformat()
+
+        if len(seat_ids) == 1:
+            return self._transition_one(seat_ids[0], from_statuses, to_status, changes)
+
+        # Each source status costs one conditional multi-row update; if any
+        # seat could not be moved, the seats that were moved are put back.
+        # The hold deadline is left in place so that undoing a confirm/release
+        # keeps it.
+        previous_status = {}
+        remaining = list(seat_ids)
+        for from_status in from_statuses:
+            if not remaining:
+                break
+            update_response = self._table().update(changes) \
+                .in_("seatid", remaining).eq("status", from_status).execute()
+
+            for seat in update_response.data:
+                previous_status[seat["seatid"]] = from_status
+            remaining = [seat_id for seat_id in remaining if seat_id not in previous_status]
+
+        if not remaining:
+            return [{"seatid": seat_id, "result": to_status} for seat_id in seat_ids], True
+
+        # Undo the partial transition, guarded on to_status so we never clobber
+        # a change someone else made in the meantime
+        for from_status in from_statuses:
+            moved = [seat_id for seat_id, status in previous_status.items() if status == from_status]
+            if moved:
+                self._table().update({"status": from_status}) \
+                    .in_("seatid", moved).eq("status", to_status).execute()
+
+        response = self._table().select("seatid").in_("seatid", remaining).execute()
+        existing = {seat["seatid"] for seat in response.data}
+        return failed_results(seat_ids, previous_status, existing), False
+
+    def _transition_one(self, seat_id, from_statuses, to_status, changes):
+        # A single seat is moved by one conditional update whatever its source
+        # status, and never needs rolling back, so its hold deadline can be cleared
+        changes.setdefault("reserved_until", None)
+        update_response = self._table().update(changes) \
+            .eq("seatid", seat_id).in_("status", from_statuses).execute()
+        if update_response.data:
+            return [{"seatid": seat_id, "result": to_status}], True
+
+        response = self._table().select("seatid").eq("seatid", seat_id).execute()
+        existing = {seat["seatid"] for seat in response.data}
+        return failed_results([seat_id], {}, existing), False
+
+    def expire_holds(self, seat_ids, now):
+        update_response = self._table().update({
+            "status": "available",
+            "reserved_until": None
+        }).in_("seatid", seat_ids).eq("status", "reserved").lte("reserved_until", now.isoformat()).execute()
+        return [seat["seatid"] for seat in update_response.data]
+
+    def reserved_holds(self, default_expiry):
+        self._table().update({
+            "reserved_until": default_expiry.isoformat()
+        }).eq("status", "reserved").is_("reserved_until", "null").execute()
+
+        rows = self._select_pages(lambda: self._table().select("seatid, reserved_until").eq("status", "reserved"))
+        return [(row["seatid"], datetime.fromisoformat(row["reserved_until"])) for row in rows]
+
+
+metadata = MetaData()
+
+seat_table = Table(
+    "seat_allocation",
+    metadata,
+    Column("seatid", String(64), primary_key=True),
+    Column("eventid", String(36), nullable=False, index=True),
+    Column("cat_no", String(20), nullable=False),
+    Column("status", String(20), nullable=False, default="available"),
+    Column("reserved_until", DateTime(timezone=True), nullable=True),
+)
+
+
+def as_utc(value):
+    # SQLite hands back naive datetimes; everything we store is UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class SqlSeatStore:
+    """Seat storage over a pooled SQLAlchemy engine (PostgreSQL, or SQLite for
+    local runs). Batches run in one transaction with the rows locked."""
+
+    def __init__(self, url, pool_size=5, max_overflow=10, pool_recycle=1800):
+        self.url = url
+        if url.startswith("sqlite"):
+            self.engine = create_engine(url)
+        else:
+            self.engine = create_engine(
+                url,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=True,
+            )
+
+    def reconnect(self):
+        # Drop connections inherited from a parent process without closing
+        # them underneath it
+        self.engine.dispose(close=False)
+
+    def create_schema(self):
+        metadata.create_all(self.engine)
+
+    def fetch_seat_rows(self, event_id=None):
+        query = select(seat_table.c.seatid, seat_table.c.eventid, seat_table.c.cat_no, seat_table.c.status)
+        if event_id is not None:
+            query = query.where(seat_table.c.eventid == str(event_id))
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings()]
+
+    def get_seats(self, seat_ids):
+        query = select(seat_table).where(seat_table.c.seatid.in_(seat_ids))
+        with self.engine.connect() as conn:
+            rows = [dict(row) for row in conn.execute(query).mappings()]
+        for row in rows:
+            if row["reserved_until"] is not None:
+                row["reserved_until"] = as_utc(row["reserved_until"]).isoformat()
+        return rows
+
+    def transition(self, seat_ids, from_statuses, to_status, reserved_until=None):
+        with self.engine.begin() as conn:
+            # Lock rows in a consistent order so concurrent batches cannot deadlock
+            locked = conn.execute(
+                select(seat_table.c.seatid, seat_table.c.status)
+                .where(seat_table.c.seatid.in_(seat_ids))
+                .order_by(seat_table.c.seatid)
+                .with_for_update()
+            ).all()
+            current_status = {seat_id: status for seat_id, status in locked}
+
+            movable = {seat_id for seat_id in seat_ids if current_status.get(seat_id) in from_statuses}
+            if len(movable) < len(seat_ids):
+                return failed_results(seat_ids, movable, current_status), False
+
+            conn.execute(
+                update(seat_table)
+                .where(seat_table.c.seatid.in_(seat_ids))
+                .values(status=to_status, reserved_until=reserved_until)
+            )
+        return [{"seatid": seat_id, "result": to_status} for seat_id in seat_ids], True
+
+    def expire_holds(self, seat_ids, now):
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(seat_table)
+                .where(
+                    seat_table.c.seatid.in_(seat_ids),
+                    seat_table.c.status == "reserved",
+                    seat_table.c.reserved_until <= now,
+                )
+                .values(status="available", reserved_until=None)
+                .returning(seat_table.c.seatid)
+            )
+            return [row.seatid for row in result]
+
+    def reserved_holds(self, default_expiry):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(seat_table)
+                .where(seat_table.c.status == "reserved", seat_table.c.reserved_until.is_(None))
+                .values(reserved_until=default_expiry)
+            )
+            rows = conn.execute(
+                select(seat_table.c.seatid, seat_table.c.reserved_until)
+                .where(seat_table.c.status == "reserved")
+            ).all()
+        return [(seat_id, as_utc(reserved_until)) for seat_id, reserved_until in rows]
+
+
+def create_seat_store():
+    """
+    Builds the seat store selected by SEAT_STORE: "supabase" (default, uses
+    SUPABASE_URL/SUPABASE_KEY) or "sql" (uses SEAT_DB_URL and the
+    SEAT_DB_POOL_* settings).
+    """
+    backend = os.getenv("SEAT_STORE", "supabase").lower()
+
+    if backend == "sql":
+        store = SqlSeatStore(
+            os.getenv("SEAT_DB_URL"),
+            pool_size=int(os.getenv("SEAT_DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("SEAT_DB_MAX_OVERFLOW", "10")),
+            pool_recycle=int(os.getenv("SEAT_DB_POOL_RECYCLE", "1800")),
+        )
+        if os.getenv("SEAT_DB_CREATE_SCHEMA", "false").lower() == "true":
+            store.create_schema()
+        return store
+
+    if backend == "supabase":
+        supabase_url = os.getenv("SUPABASE_URL")
+        print(f"SUPABASE_URL: {supabase_url}")
+        return SupabaseSeatStore(supabase_url, os.getenv("SUPABASE_KEY"))
+
+    raise ValueError(f"Unknown SEAT_STORE '{backend}', expected 'supabase' or 'sql'")
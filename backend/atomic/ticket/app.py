@@ -2,9 +2,11 @@ import logging
 import threading
 import sys
 import os
-from flask import Flask
+from flask import Flask, jsonify
+from flask_migrate import Migrate, upgrade
 from config import Config
 from db import db
+from pool_stats import pool_stats
 from flask_cors import CORS
 
 # Ensure current directory is in Python path
@@ -14,28 +16,50 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+migrate = Migrate(directory=MIGRATIONS_DIR)
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config) # Load configurations
     db.init_app(app) # Initialise the database
+    migrate.init_app(app, db) # Schema changes are managed with `flask db`
     CORS(app) # Enable CORS for all routes
     
     # Import routes after app is initialised
     from routes import register_routes
     register_routes(app)
 
+    # Connection pool usage and wait times of the worker that answers
+    @app.route("/metrics/db-pool", methods=["GET"])
+    def db_pool_metrics():
+        return jsonify(pool_stats(db.engine)), 200
+
     return app
 
 app = create_app()
 
-if __name__ == '__main__' and threading.current_thread() == threading.main_thread():
+# Run once before the service starts serving
+def init_db():
     try:
         with app.app_context(): 
             logger.info("Creating database tables...")
             db.create_all()
             logger.info("Database tables created successfully")
+            # Bring tables created before a schema change (e.g. new indexes) up to date
+            upgrade(directory=MIGRATIONS_DIR)
+            logger.info("Database migrations applied")
     except Exception as e:
         logger.error(f"Failed to create database tables: {str(e)}")
+
+# Run in each server worker forked from a process that already imported the
+# app, so workers don't share the parent's pooled connections
+def after_fork():
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+if __name__ == '__main__' and threading.current_thread() == threading.main_thread():
+    init_db()
     
     # Start the Flask application
     app.run(host="0.0.0.0", port=5005, debug=True, use_reloader=False)  # Disable reloader when using threads
\ No newline at end of file
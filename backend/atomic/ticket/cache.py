@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache. Entries expire `ttl` seconds after they
+    were stored; once `max_entries` is reached the least recently used entry
+    is evicted. Each worker process has its own copy, so an invalidation in
+    one process is only seen by the others once their entry expires.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisCache:
+    """Cache shared by every worker and replica, kept in Redis with a TTL.
+    Redis errors are logged and treated as misses, so reads fall back to the
+    database."""
+
+    def __init__(self, url, ttl=30, prefix="ticket:"):
+        # Imported here so the service runs without redis unless it is selected
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"Ticket cache read failed: {str(e)}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Ticket cache write failed: {str(e)}")
+
+    def delete(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if not keys:
+            return
+        try:
+            self.client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Ticket cache invalidation failed: {str(e)}")
+
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, keys):
+        pass
+
+
+def create_ticket_cache():
+    """
+    Builds the ticket cache selected by TICKET_CACHE: "local" (default, an
+    in-process LRU of TICKET_CACHE_MAX_ENTRIES), "redis" (shared, at
+    TICKET_CACHE_URL) or "none". Entries live for TICKET_CACHE_TTL seconds.
+
+    A local cache only sees invalidations made by its own process, so with
+    more than one server worker (WEB_WORKERS) it is replaced by no cache.
+    """
+    backend = os.getenv("TICKET_CACHE", "local").lower()
+    ttl = int(os.getenv("TICKET_CACHE_TTL", "30"))
+
+    if backend == "local" and int(os.getenv("WEB_WORKERS", "1")) > 1:
+        logger.warning("TICKET_CACHE=local with several workers would serve stale tickets; caching is off. "
+                       "Use TICKET_CACHE=redis to cache across workers.")
+        backend = "none"
+
+    if backend == "local":
+        return LocalCache(max_entries=int(os.getenv("TICKET_CACHE_MAX_ENTRIES", "10000")), ttl=ttl)
+    if backend == "redis":
+        return RedisCache(os.getenv("TICKET_CACHE_URL", "redis://localhost:6379/0"), ttl=ttl)
+    if backend == "none":
+        return NoCache()
+
+    raise ValueError(f"Unknown TICKET_CACHE '{backend}', expected 'local', 'redis' or 'none'")
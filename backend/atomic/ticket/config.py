@@ -1,6 +1,9 @@
 import os
 from dotenv import load_dotenv, find_dotenv
 
+# Shared with the other services from backend/common, which is on PYTHONPATH
+from pool_stats import engine_options
+
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
 
@@ -8,4 +11,6 @@ print("DATABASE_URL:", os.getenv("TICKET_DB_URL"))
 
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("TICKET_DB_URL")
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool sizing from DB_POOL_* (see backend/common/pool_stats.py)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""add ticket seat category
+
+Revision ID: 345f7355ed0f
+Revises: 47c0713d67e0
+Create Date: 2026-10-17 11:41:56.203771
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '345f7355ed0f'
+down_revision = '47c0713d67e0'
+branch_labels = None
+depends_on = None
+
+
+# Seat IDs look like "E04_F06_cat_1": section letter and seat number, then the category
+SEAT_ID_PATTERN = re.compile(r"^E\d+_([A-Za-z]+)\d+_(.+)$")
+
+BACKFILL_BATCH_SIZE = 1000
+
+ticket = sa.table(
+    'ticket',
+    sa.column('ticketID', sa.String),
+    sa.column('seatID', sa.String),
+    sa.column('cat_no', sa.String),
+    sa.column('section', sa.String),
+)
+
+
+def backfill():
+    # Fill cat_no/section of existing tickets from their seat IDs, walking the
+    # table in ticketID order one batch at a time
+    conn = op.get_bind()
+    last_ticket_id = ''
+    while True:
+        rows = conn.execute(
+            sa.select(ticket.c.ticketID, ticket.c.seatID)
+            .where(ticket.c.ticketID > last_ticket_id)
+            .order_by(ticket.c.ticketID)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+
+        updates = []
+        for ticket_id, seat_id in rows:
+            match = SEAT_ID_PATTERN.match(seat_id)
+            if match:
+                updates.append({'id': ticket_id, 'cat_no': match.group(2), 'section': match.group(1).upper()})
+        if updates:
+            conn.execute(
+                ticket.update()
+                .where(ticket.c.ticketID == sa.bindparam('id'))
+                .values(cat_no=sa.bindparam('cat_no'), section=sa.bindparam('section')),
+                updates
+            )
+        last_ticket_id = rows[-1][0]
+
+
+def upgrade():
+    # create_all() may already have added the columns to a new database
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('ticket')}
+    if 'cat_no' not in columns:
+        op.add_column('ticket', sa.Column('cat_no', sa.String(length=20), nullable=True))
+    if 'section' not in columns:
+        op.add_column('ticket', sa.Column('section', sa.String(length=8), nullable=True))
+    backfill()
+
+    # See 3a8f8d7a8e2b for why IF NOT EXISTS and CONCURRENTLY. The listed
+    # tickets index gains cat_no, so it replaces the eventID-only one.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_ticket_listed_eventID_cat_no', 'ticket', ['eventID', 'cat_no'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True,
+                        postgresql_where=sa.text('listed_for_trade'), sqlite_where=sa.text('listed_for_trade = 1'))
+        op.drop_index('ix_ticket_listed_eventID', table_name='ticket', if_exists=True,
+                      postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_ticket_listed_eventID', 'ticket', ['eventID'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True,
+                        postgresql_where=sa.text('listed_for_trade'), sqlite_where=sa.text('listed_for_trade'))
+        op.drop_index('ix_ticket_listed_eventID_cat_no', table_name='ticket', if_exists=True,
+                      postgresql_concurrently=True)
+
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_column('section')
+        batch_op.drop_column('cat_no')
@@ -0,0 +1,47 @@
+"""add ticket indexes
+
+Revision ID: 3a8f8d7a8e2b
+Revises: 
+Create Date: 2026-10-17 11:25:03.031510
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a8f8d7a8e2b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (name, columns, extra options), as declared in Ticket.__table_args__ at this
+# revision. An (eventID, listed_for_trade) index was listed here too; it is
+# covered by the other event indexes, and cc3c5963bf0b drops it where it was built.
+INDEXES = [
+    ('ix_ticket_transactionID', ['transactionID'], {}),
+    ('ix_ticket_seatID', ['seatID'], {}),
+    ('ix_ticket_userID_eventID', ['userID', 'eventID'], {}),
+    ('ix_ticket_listed_eventID', ['eventID'], {
+        'postgresql_where': sa.text('listed_for_trade'),
+        'sqlite_where': sa.text('listed_for_trade'),
+    }),
+]
+
+
+def upgrade():
+    # The ticket table predates migrations: databases set up with
+    # db.create_all() after this revision already have the indexes, hence
+    # IF NOT EXISTS. On PostgreSQL the indexes are built CONCURRENTLY so a
+    # live table keeps taking writes, which has to run outside a transaction.
+    with op.get_context().autocommit_block():
+        for name, columns, options in INDEXES:
+            op.create_index(name, 'ticket', columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name='ticket', if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""add ticket event keyset index
+
+Revision ID: 47c0713d67e0
+Revises: 3a8f8d7a8e2b
+Create Date: 2026-10-17 11:34:12.418207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '47c0713d67e0'
+down_revision = '3a8f8d7a8e2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # See 3a8f8d7a8e2b for why IF NOT EXISTS and CONCURRENTLY
+    with op.get_context().autocommit_block():
+        op.create_index('ix_ticket_eventID_ticketID', 'ticket', ['eventID', 'ticketID'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_ticket_eventID_ticketID', table_name='ticket', if_exists=True,
+                      postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""drop ticket event listed index
+
+Revision ID: cc3c5963bf0b
+Revises: 345f7355ed0f
+Create Date: 2026-10-17 12:14:37.602114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc3c5963bf0b'
+down_revision = '345f7355ed0f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lookups by event use ix_ticket_eventID_ticketID and listed tickets the
+    # partial ix_ticket_listed_eventID_cat_no, so this index only slowed down
+    # ticket writes. See 3a8f8d7a8e2b for why IF EXISTS and CONCURRENTLY.
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_ticket_eventID_listed_for_trade', table_name='ticket', if_exists=True,
+                      postgresql_concurrently=True)
+
+
+def downgrade():
+    # 3a8f8d7a8e2b no longer creates the index either, so there is nothing to restore
+    pass
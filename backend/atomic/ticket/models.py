@@ -10,6 +10,30 @@ class Ticket(db.Model):
     status = db.Column(db.String(20), nullable=False, default="pending_payment")
     transactionID = db.Column(db.String(64), nullable=True)
     listed_for_trade = db.Column(Boolean, nullable=False, default=False)
+    # Copied from the seat when the ticket is created and swapped along with
+    # seatID in trades, so listings can filter on them without asking seat_allocation
+    cat_no = db.Column(db.String(20), nullable=True)
+    section = db.Column(db.String(8), nullable=True)
+
+    # Indexes for the lookups the routes make. Existing databases get them
+    # through the migration in migrations/versions.
+    __table_args__ = (
+        db.Index("ix_ticket_transactionID", transactionID),
+        db.Index("ix_ticket_seatID", seatID),
+        # userID first, so the index also serves lookups by user alone
+        db.Index("ix_ticket_userID_eventID", userID, eventID),
+        # Keyset pages of an event's tickets in ticketID order; also serves
+        # lookups by event alone
+        db.Index("ix_ticket_eventID_ticketID", eventID, ticketID),
+        # Only the few tickets listed for trade, for the trade marketplace. The
+        # predicate is written the way SQLAlchemy renders a listed_for_trade
+        # filter, as the planner only uses a partial index for a matching one.
+        db.Index(
+            "ix_ticket_listed_eventID_cat_no", eventID, cat_no,
+            postgresql_where=listed_for_trade,
+            sqlite_where=db.text("listed_for_trade = 1")
+        ),
+    )
 
 
     def to_dict(self):
@@ -20,5 +44,7 @@ class Ticket(db.Model):
             "status": self.status,
             "transactionID": self.transactionID,
             "userID": self.userID,
-            "listed_for_trade": self.listed_for_trade
-        }
\ No newline at end of file
+            "listed_for_trade": self.listed_for_trade,
+            "cat_no": self.cat_no,
+            "section": self.section
+        }
@@ -1,8 +1,13 @@
 import logging
+import json
+import re
 import requests
-from flask import request, jsonify
+from itertools import islice
+from flask import Response, request, jsonify, stream_with_context
+from sqlalchemy import insert, update
 from db import db
 from models import Ticket
+from cache import create_ticket_cache
 from config import Config
 import uuid
 
@@ -11,6 +16,222 @@ logger = logging.getLogger(__name__)
 
 TRADE_TICKET_SERVICE_URL = "http://trade_ticket_service:8003"
 
+# Read-through cache for GET /ticket/<ticketID>. Every route that changes a
+# ticket deletes its entry after committing.
+ticket_cache = create_ticket_cache()
+
+# Seat IDs look like "E04_F06_cat_1" or "E03_A04_vip": event, section letter
+# and seat number within the section, then the category
+SEAT_ID_PATTERN = re.compile(r"^E\d+_([A-Za-z]+)\d+_(.+)$")
+
+def seat_location(ticket_data):
+    """(cat_no, section) for a new ticket: as given in the request, or read off the seat ID."""
+    match = SEAT_ID_PATTERN.match(str(ticket_data['seatID']))
+    cat_no = ticket_data.get('cat_no') or (match.group(2) if match else None)
+    section = ticket_data.get('section') or (match.group(1).upper() if match else None)
+    return cat_no, section
+
+# Columns a ticket listing can be projected to with ?fields=
+TICKET_FIELDS = ("ticketID", "eventID", "seatID", "userID", "status", "transactionID", "listed_for_trade",
+                 "cat_no", "section")
+
+# Query parameters that filter a ticket listing in SQL
+#   eventID          - tickets of this event (only on /tickets/user)
+#   status           - one status, or several separated by commas
+#   cat_no, section  - seat category / section, one or several separated by commas
+#   listed_for_trade - true/false
+#   has_transaction  - true for paid tickets, false for tickets without a transactionID
+# Returns (criteria, error message)
+def ticket_filters(args, allow_event=False):
+    criteria = []
+
+    if allow_event and args.get("eventID"):
+        criteria.append(Ticket.eventID == args["eventID"])
+
+    for name in ("status", "cat_no", "section"):
+        if args.get(name):
+            criteria.append(getattr(Ticket, name).in_(args[name].split(",")))
+
+    for name in ("listed_for_trade", "has_transaction"):
+        value = args.get(name)
+        if value is None:
+            continue
+        if value.lower() not in ("true", "false"):
+            return None, f"{name} must be true or false"
+        flag = value.lower() == "true"
+        if name == "listed_for_trade":
+            # The bare column (not "IS true") matches the predicate of the
+            # partial index on listed tickets, so the planner can use it
+            criteria.append(Ticket.listed_for_trade if flag else Ticket.listed_for_trade.is_(False))
+        else:
+            criteria.append(Ticket.transactionID.isnot(None) if flag else Ticket.transactionID.is_(None))
+
+    return criteria, None
+
+# Columns requested with ?fields= (all of TICKET_FIELDS by default)
+# Returns (fields, error message)
+def ticket_fields(args):
+    fields = args.get("fields")
+    if not fields:
+        return list(TICKET_FIELDS), None
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in TICKET_FIELDS]
+    if unknown:
+        return None, f"Unknown fields: {unknown}. Allowed fields: {list(TICKET_FIELDS)}"
+    return fields, None
+
+def ticket_query(criteria, fields):
+    return db.session.query(*[getattr(Ticket, field) for field in fields]).filter(*criteria)
+
+# Runs a filtered, projected ticket listing: only the requested columns are
+# selected, and rows come back as plain dicts rather than ORM objects
+def list_tickets(criteria, fields):
+    return [dict(zip(fields, row)) for row in ticket_query(criteria, fields).all()]
+
+# Rows fetched from the database (and sent to the client) at a time when
+# streaming a listing
+STREAM_BATCH_SIZE = 1000
+
+# Streams a listing as one JSON array in ticketID order, reading rows through
+# a server-side cursor STREAM_BATCH_SIZE at a time, so memory use stays flat
+# however many tickets match. Returns None if nothing matches.
+def stream_tickets(criteria, fields, limit=None):
+    query = ticket_query(criteria, fields).order_by(Ticket.ticketID) \
+        .execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE)
+    if limit:
+        query = query.limit(limit)
+
+    rows = iter(query)
+    first = next(rows, None)
+    if first is None:
+        return None
+
+    def generate():
+        yield "[" + json.dumps(dict(zip(fields, first)))
+        while True:
+            batch = list(islice(rows, STREAM_BATCH_SIZE))
+            if not batch:
+                break
+            yield "".join("," + json.dumps(dict(zip(fields, row))) for row in batch)
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# Runs a guarded bulk UPDATE on the tickets matching criteria and returns the
+# IDs it changed. The guard is part of the WHERE clause, so tickets that are
+# not in the expected state are skipped by the database rather than checked
+# one by one here.
+def bulk_update(criteria, values):
+    return db.session.execute(
+        update(Ticket)
+        .where(*criteria)
+        .values(**values)
+        .returning(Ticket.ticketID)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+# Tickets a bulk update skipped, keyed by ticketID, to explain each outcome
+def skipped_tickets(criteria, updated_ids):
+    return {
+        ticket.ticketID: ticket
+        for ticket in Ticket.query.filter(*criteria).all()
+        if ticket.ticketID not in updated_ids
+    }
+
+# Per-ticket outcome of a bulk void: "voided", or why the ticket was left alone
+def void_results(ticket_ids, updated_ids, skipped):
+    results = []
+    for ticket_id in ticket_ids:
+        ticket = skipped.get(ticket_id)
+        if ticket_id in updated_ids:
+            result = "voided"
+        elif ticket is None:
+            result = "not_found"
+        elif ticket.status == "voided":
+            result = "already_voided"
+        else:
+            result = "listed_for_trade"
+        results.append({"ticketID": ticket_id, "result": result})
+    return results
+
+# Swaps the seats (with their category/section) of two confirmed tickets owned
+# by two different users, and takes both off the trade listing. Both rows are
+# locked in ticketID order, so two trades touching the same tickets cannot
+# deadlock and the second one sees the first one's result: the requested
+# ticket is no longer listed, so a duplicate or competing accept gets a 409.
+def swap_ticket_seats(trade_request_id, ticket1_id, ticket2_id, user1_id, user2_id):
+    # Additional validation to ensure we're not trading between same user
+    if user1_id == user2_id:
+        return jsonify({
+            "error": "Cannot trade tickets between the same user"
+        }), 400
+
+    locked = Ticket.query.filter(Ticket.ticketID.in_([ticket1_id, ticket2_id])) \
+        .order_by(Ticket.ticketID).with_for_update().all()
+    tickets = {ticket.ticketID: ticket for ticket in locked}
+    ticket1 = tickets.get(ticket1_id)
+    ticket2 = tickets.get(ticket2_id)
+
+    if not ticket1 or not ticket2 or ticket1_id == ticket2_id:
+        db.session.rollback()
+        return jsonify({"error": "One or both tickets not found"}), 404
+
+    # Make sure tickets are in a valid state to trade
+    if ticket1.status != "confirmed" or ticket2.status != "confirmed":
+        invalid_ticket = ticket1 if ticket1.status != "confirmed" else ticket2
+        db.session.rollback()
+        return jsonify({
+            "error": f"Cannot trade ticket with status: {invalid_ticket.status}. Both tickets must be confirmed."
+        }), 400
+
+    if ticket1.userID != user1_id or ticket2.userID != user2_id:
+        db.session.rollback()
+        return jsonify({"error": "Tickets are no longer owned by the users in the trade"}), 409
+
+    if not ticket2.listed_for_trade:
+        db.session.rollback()
+        return jsonify({"error": "Requested ticket is no longer listed for trade"}), 409
+
+    # Swap seats (and their category/section) between the two owners
+    ticket1.seatID, ticket2.seatID = ticket2.seatID, ticket1.seatID
+    ticket1.cat_no, ticket2.cat_no = ticket2.cat_no, ticket1.cat_no
+    ticket1.section, ticket2.section = ticket2.section, ticket1.section
+
+    # Traded tickets are no longer available for other trade requests
+    ticket1.listed_for_trade = False
+    ticket2.listed_for_trade = False
+
+    # Commit the changes in a single transaction
+    db.session.commit()
+    ticket_cache.delete([ticket1_id, ticket2_id])
+
+    logger.info(f"Trade completed successfully. Seat {ticket1.seatID} now belongs to Ticket {ticket1_id} owned by {user1_id}, Seat {ticket2.seatID} now belongs to Ticket {ticket2_id} owned by {user2_id}")
+
+    return jsonify({
+        "message": "Trade completed successfully",
+        "tradeRequestID": trade_request_id,
+        "tickets": [
+            {
+                "ticketID": ticket1_id,
+                "newSeatID": ticket1.seatID
+            },
+            {
+                "ticketID": ticket2_id,
+                "newSeatID": ticket2.seatID
+            }
+        ]
+    }), 200
+
+# Tickets can be voided unless they already are, or are listed for trade
+VOIDABLE = (Ticket.status != "voided", Ticket.listed_for_trade.is_(False))
+
+# Reads and de-duplicates the "ticketIDs" list from a bulk request body
+def get_ticket_ids(data):
+    ticket_ids = data.get("ticketIDs")
+    if not isinstance(ticket_ids, list) or not ticket_ids:
+        return None
+    return list(dict.fromkeys(str(ticket_id) for ticket_id in ticket_ids))
+
 def register_routes(app):
     
     # Create a Pending Ticket
@@ -27,13 +248,16 @@ def register_routes(app):
         
             # Create a new ticket
             ticketID = str(uuid.uuid4())
+            cat_no, section = seat_location(data)
             new_ticket = Ticket(
                 ticketID=ticketID,
                 eventID=data['eventID'],
                 seatID=data['seatID'],
                 userID=data['userID'],
                 status="pending_payment",
-                listed_for_trade=False
+                listed_for_trade=False,
+                cat_no=cat_no,
+                section=section
             )
         
             db.session.add(new_ticket)
@@ -45,7 +269,9 @@ def register_routes(app):
                 "seatID": data['seatID'],
                 "userID": data['userID'],
                 "status": "pending_payment",
-                "listed_for_trade": False
+                "listed_for_trade": False,
+                "cat_no": cat_no,
+                "section": section
             }), 201
     
         except Exception as e:
@@ -53,6 +279,50 @@ def register_routes(app):
             logger.error(f"Error creating ticket: {str(e)}")
             return jsonify({"error": "Failed to create ticket"}), 500
 
+    # Create several Pending Tickets at once
+    # Expects {"tickets": [{"eventID", "seatID", "userID", optional "cat_no"/"section"}, ...]}; all rows go in
+    # with one multi-row INSERT and one commit, so either every ticket is created or none
+    @app.route('/tickets/batch', methods=['POST'])
+    def create_tickets_batch():
+        try:
+            data = request.get_json(silent=True) or {}
+            tickets = data.get("tickets")
+
+            if not isinstance(tickets, list) or not tickets:
+                return jsonify({"error": "Missing required field: tickets"}), 400
+
+            # Validate required fields
+            required_fields = ['eventID', 'seatID', 'userID']
+            for position, ticket in enumerate(tickets):
+                for field in required_fields:
+                    if not isinstance(ticket, dict) or field not in ticket:
+                        return jsonify({"error": f"Missing required field: {field} (ticket {position})"}), 400
+
+            rows = [{
+                "ticketID": str(uuid.uuid4()),
+                "eventID": ticket['eventID'],
+                "seatID": ticket['seatID'],
+                "userID": ticket['userID'],
+                "status": "pending_payment",
+                "listed_for_trade": False,
+                **dict(zip(("cat_no", "section"), seat_location(ticket)))
+            } for ticket in tickets]
+
+            db.session.execute(insert(Ticket).values(rows))
+            db.session.commit()
+
+            logger.info(f"Created {len(rows)} pending ticket(s): {[row['ticketID'] for row in rows]}")
+
+            return jsonify({
+                "ticketIDs": [row["ticketID"] for row in rows],
+                "tickets": rows
+            }), 201
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error creating tickets: {str(e)}")
+            return jsonify({"error": "Failed to create tickets"}), 500
+
     # Confirm Ticket After Payment
     @app.route('/ticket/confirm/<ticketID>', methods=['PUT'])
     def confirm_ticket(ticketID):
@@ -96,6 +366,7 @@ def register_routes(app):
             ticket.status = "confirmed"
             ticket.transactionID = data['transactionID']
             db.session.commit()
+            ticket_cache.delete([ticketID])
 
             logger.info(f"Ticket {ticketID} confirmed with transaction {data['transactionID']}")
         
@@ -111,24 +382,80 @@ def register_routes(app):
             logger.error(f"Error confirming ticket: {str(e)}")
             return jsonify({"error": "Failed to confirm ticket"}), 500
 
+    # Confirm several Tickets of one order after payment
+    # Expects {"ticketIDs": [...], "transactionID": "..."}; one UPDATE moves every
+    # pending ticket in the list, and each ticket's outcome is reported:
+    # confirmed, already_confirmed, conflict (confirmed with another transaction),
+    # invalid_status or not_found
+    @app.route('/tickets/confirm', methods=['PUT'])
+    def confirm_tickets():
+        try:
+            data = request.get_json(silent=True) or {}
+            ticket_ids = get_ticket_ids(data)
+            transaction_id = data.get("transactionID")
+
+            if ticket_ids is None:
+                return jsonify({"error": "Missing required field: ticketIDs"}), 400
+            if not transaction_id:
+                return jsonify({"error": "Missing required field: transactionID"}), 400
+
+            criteria = [Ticket.ticketID.in_(ticket_ids)]
+            updated_ids = set(bulk_update(
+                criteria + [Ticket.status == "pending_payment"],
+                {"status": "confirmed", "transactionID": transaction_id}
+            ))
+            skipped = skipped_tickets(criteria, updated_ids)
+            db.session.commit()
+            ticket_cache.delete(updated_ids)
+
+            results = []
+            for ticket_id in ticket_ids:
+                ticket = skipped.get(ticket_id)
+                if ticket_id in updated_ids:
+                    results.append({"ticketID": ticket_id, "result": "confirmed"})
+                elif ticket is None:
+                    results.append({"ticketID": ticket_id, "result": "not_found"})
+                elif ticket.status == "confirmed" and ticket.transactionID == transaction_id:
+                    results.append({"ticketID": ticket_id, "result": "already_confirmed"})
+                elif ticket.status == "confirmed":
+                    logger.warning(f"Conflicting transactionID for ticket {ticket_id}. Existing: {ticket.transactionID}, Received: {transaction_id}")
+                    results.append({"ticketID": ticket_id, "result": "conflict"})
+                else:
+                    results.append({"ticketID": ticket_id, "result": "invalid_status", "status": ticket.status})
+
+            logger.info(f"Confirmed {len(updated_ids)} ticket(s) with transaction {transaction_id}")
+
+            failed = [result for result in results if result["result"] not in ("confirmed", "already_confirmed")]
+            if failed:
+                return jsonify({"error": "One or more tickets could not be confirmed", "results": results}), 409
+
+            return jsonify({
+                "message": "Tickets successfully confirmed",
+                "transactionID": transaction_id,
+                "results": results
+            }), 200
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error confirming tickets: {str(e)}")
+            return jsonify({"error": "Failed to confirm tickets"}), 500
+
     # Get Ticket Status
     @app.route('/ticket/<ticketID>', methods=['GET'])
     def get_ticket(ticketID):
         try:
+            cached = ticket_cache.get(ticketID)
+            if cached is not None:
+                return jsonify(cached), 200
+
             ticket = Ticket.query.filter_by(ticketID=ticketID).first()
         
             if not ticket:
                 return jsonify({"error": "Ticket not found"}), 404
-            
-            return jsonify({
-                "ticketID": ticket.ticketID,
-                "eventID": ticket.eventID,
-                "seatID": ticket.seatID,
-                "userID": ticket.userID,
-                "status": ticket.status,
-                "transactionID": ticket.transactionID,
-                "listed_for_trade": ticket.listed_for_trade
-            }), 200
+
+            details = ticket.to_dict()
+            ticket_cache.set(ticketID, details)
+            return jsonify(details), 200
     
         except Exception as e:
             logger.error(f"Error retrieving ticket: {str(e)}")
@@ -147,25 +474,70 @@ def register_routes(app):
             return jsonify({"error": "Failed to retrieve tickets"}), 500
     
     # Get Tickets by EventID
+    # Optional query params: status, listed_for_trade, has_transaction, fields (see ticket_filters)
+    # For large events:
+    #   limit  - page size; the response becomes {"tickets": [...], "next_cursor": ...}
+    #   after  - keyset cursor: only tickets with a ticketID after this one
+    #   stream - true to stream the whole listing as a JSON array, read in batches
     @app.route("/tickets/event/<event_id>", methods=["GET"])
     def get_tickets_by_event(event_id):
         try:
-            tickets = Ticket.query.filter_by(eventID=event_id).all()
+            criteria, error = ticket_filters(request.args)
+            fields, fields_error = ticket_fields(request.args)
+            if error or fields_error:
+                return jsonify({"error": error or fields_error}), 400
+
+            limit = request.args.get("limit")
+            if limit is not None:
+                if not limit.isdigit() or int(limit) < 1:
+                    return jsonify({"error": "limit must be a positive integer"}), 400
+                limit = int(limit)
+
+            not_found_message = "No matching tickets" if criteria else "Event ID does not exist"
+            criteria = [Ticket.eventID == event_id] + criteria
+            if request.args.get("after"):
+                criteria.append(Ticket.ticketID > request.args["after"])
+
+            if request.args.get("stream", "").lower() == "true":
+                response = stream_tickets(criteria, fields, limit)
+                if response is None:
+                    return jsonify({"error": not_found_message}), 404
+                return response
+
+            if limit is not None:
+                # The cursor is the last ticketID of the page, so the ID is always selected
+                page_fields = fields if "ticketID" in fields else fields + ["ticketID"]
+                rows = ticket_query(criteria, page_fields).order_by(Ticket.ticketID).limit(limit).all()
+                tickets = [dict(zip(page_fields, row)) for row in rows]
+                next_cursor = tickets[-1]["ticketID"] if len(tickets) == limit else None
+                if page_fields is not fields:
+                    for ticket in tickets:
+                        del ticket["ticketID"]
+                return jsonify({"tickets": tickets, "next_cursor": next_cursor}), 200
+
+            tickets = list_tickets(criteria, fields)
             if tickets == []:
-                return jsonify({"error": "Event ID does not exist"}), 404
-            return jsonify([ticket.to_dict() for ticket in tickets]), 200
+                return jsonify({"error": not_found_message}), 404
+            return jsonify(tickets), 200
         except Exception as e:
             logger.error(f"Error retrieving tickets: {str(e)}")
             return jsonify({"error": "Failed to retrieve tickets"}), 500
 
     # Get Tickets by User ID
+    # Optional query params: eventID, status, listed_for_trade, has_transaction, fields (see ticket_filters)
     @app.route('/tickets/user/<user_id>', methods=['GET'])
     def get_tickets_by_user(user_id):
         try:
-            tickets = Ticket.query.filter_by(userID=user_id).all()
+            criteria, error = ticket_filters(request.args, allow_event=True)
+            fields, fields_error = ticket_fields(request.args)
+            if error or fields_error:
+                return jsonify({"error": error or fields_error}), 400
+
+            tickets = list_tickets([Ticket.userID == user_id] + criteria, fields)
             if tickets == []:
-                return jsonify({"error": "User ID does not exist"}), 404
-            return jsonify([ticket.to_dict() for ticket in tickets]), 200
+                message = "No matching tickets" if criteria else "User ID does not exist"
+                return jsonify({"error": message}), 404
+            return jsonify(tickets), 200
         except Exception as e:
             logger.error(f"Error retrieving tickets: {str(e)}")
             return jsonify({"error": "Failed to retrieve tickets"}), 500
@@ -201,6 +573,7 @@ def register_routes(app):
             ticket.status = "voided"
         
             db.session.commit()
+            ticket_cache.delete([ticketID])
         
             # Log the status change
             logger.info(f"Ticket {ticketID} voided. Previous status: {previous_status}")
@@ -217,6 +590,89 @@ def register_routes(app):
             logger.error(f"Error voiding ticket: {str(e)}")
             return jsonify({"error": "Failed to void ticket"}), 500
     
+    # Void several tickets at once
+    # Expects {"ticketIDs": [...]}; one guarded UPDATE voids every ticket that is
+    # not already voided or listed for trade, and each ticket's outcome is reported
+    @app.route('/tickets/void', methods=['PUT'])
+    def void_tickets():
+        try:
+            data = request.get_json(silent=True) or {}
+            ticket_ids = get_ticket_ids(data)
+
+            if ticket_ids is None:
+                return jsonify({"error": "Missing required field: ticketIDs"}), 400
+
+            criteria = [Ticket.ticketID.in_(ticket_ids)]
+            updated_ids = set(bulk_update(criteria + list(VOIDABLE), {"status": "voided"}))
+            skipped = skipped_tickets(criteria, updated_ids)
+            db.session.commit()
+            ticket_cache.delete(updated_ids)
+
+            logger.info(f"Voided {len(updated_ids)} ticket(s): {sorted(updated_ids)}")
+            return void_response(void_results(ticket_ids, updated_ids, skipped))
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error voiding tickets: {str(e)}")
+            return jsonify({"error": "Failed to void tickets"}), 500
+
+    # Void every ticket bought in a transaction, in one guarded UPDATE
+    @app.route('/tickets/void/transaction/<transactionID>', methods=['PUT'])
+    def void_tickets_by_transaction(transactionID):
+        try:
+            criteria = [Ticket.transactionID == transactionID]
+            updated_ids = set(bulk_update(criteria + list(VOIDABLE), {"status": "voided"}))
+            skipped = skipped_tickets(criteria, updated_ids)
+            db.session.commit()
+            ticket_cache.delete(updated_ids)
+
+            if not updated_ids and not skipped:
+                return jsonify({"error": "Transaction ID does not exist"}), 404
+
+            logger.info(f"Voided {len(updated_ids)} ticket(s) of transaction {transactionID}")
+            return void_response(void_results(sorted(updated_ids | set(skipped)), updated_ids, skipped))
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error voiding tickets: {str(e)}")
+            return jsonify({"error": "Failed to void tickets"}), 500
+
+    # 200 when every ticket ended up voided, otherwise 409 with the per-ticket results
+    def void_response(results):
+        failed = [result for result in results if result["result"] not in ("voided", "already_voided")]
+        if failed:
+            return jsonify({"error": "One or more tickets could not be voided", "results": results}), 409
+        return jsonify({"message": "Tickets successfully voided", "results": results}), 200
+
+    # Void the pending tickets held on a set of seats (used when seat holds expire)
+    @app.route('/tickets/void/pending-seats', methods=['PUT'])
+    def void_pending_tickets_for_seats():
+        try:
+            data = request.get_json(silent=True) or {}
+            seat_ids = data.get("seat_ids")
+
+            if not isinstance(seat_ids, list) or not seat_ids:
+                return jsonify({"error": "Missing required field: seat_ids"}), 400
+
+            voided_ids = bulk_update(
+                [Ticket.seatID.in_(seat_ids), Ticket.status == "pending_payment"],
+                {"status": "voided"}
+            )
+            db.session.commit()
+            ticket_cache.delete(voided_ids)
+
+            logger.info(f"Voided {len(voided_ids)} pending ticket(s) for expired seats: {voided_ids}")
+
+            return jsonify({
+                "message": f"Voided {len(voided_ids)} pending ticket(s)",
+                "ticketIDs": voided_ids
+            }), 200
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error voiding pending tickets: {str(e)}")
+            return jsonify({"error": "Failed to void pending tickets"}), 500
+
     # Function to allow user to list the ticket for trade
     @app.route("/ticket/<ticket_id>/list-for-trade", methods=["PUT"])
     def list_for_trade(ticket_id):
@@ -233,6 +689,7 @@ def register_routes(app):
             
             ticket.listed_for_trade = bool(list_status)
             db.session.commit()
+            ticket_cache.delete([ticket_id])
 
             return jsonify({
                 "message": f"Ticket {ticket_id} listing status updated",
@@ -242,12 +699,39 @@ def register_routes(app):
         except Exception as e:
             return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+    # Swap the seats of two tickets for an accepted trade
+    # Expects {"ticketID", "requestedTicketID", "requesterID", "requestedUserID"} and
+    # optionally "tradeRequestID". Both rows are locked, checked, swapped and unlisted
+    # in one transaction, so concurrent accepts on the same tickets run one after another.
+    @app.route('/tickets/trade/swap', methods=['PUT'])
+    def swap_tickets():
+        try:
+            data = request.get_json(silent=True) or {}
+
+            required_fields = ["ticketID", "requestedTicketID", "requesterID", "requestedUserID"]
+            for field in required_fields:
+                if not data.get(field):
+                    return jsonify({"error": f"Missing required field: {field}"}), 400
+
+            return swap_ticket_seats(
+                data.get("tradeRequestID"),
+                str(data["ticketID"]), str(data["requestedTicketID"]),
+                str(data["requesterID"]), str(data["requestedUserID"])
+            )
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error in swap_tickets: {str(e)}")
+            return jsonify({"error": f"Failed to process trade: {str(e)}"}), 500
+
     # Function to swap ownership of tickets
     @app.route('/ticket/trade/request/<trade_request_id>', methods=['PUT'])
     def trade_ticket_by_request_id(trade_request_id):
         """
         Process a ticket trade using the trade request ID
-        This finds both tickets associated with the trade request and swaps ownership
+        This looks up the trade request in the Trade Ticket Composite, then swaps
+        the seats like /tickets/trade/swap (which callers that already have the
+        trade details should use instead)
         """
         try:
             # Step 1: Get trade request details from Trade Ticket Composite
@@ -257,55 +741,13 @@ def register_routes(app):
                 return jsonify({"error": "Trade request not found"}), 404
             
             trade_data = response.json()
-            ticket1_id = trade_data.get("ticketID")
-            ticket2_id = trade_data.get("requestedTicketID")
-            user1_id = trade_data.get("requesterID")
-            user2_id = trade_data.get("requestedUserID")
-
-            # Step 2: Load both tickets
-            ticket1 = Ticket.query.filter_by(ticketID=ticket1_id).first()
-            ticket2 = Ticket.query.filter_by(ticketID=ticket2_id).first()
 
-            if not ticket1 or not ticket2:
-                return jsonify({"error": "One or both tickets not found"}), 404
-            
-            # Additional validation to ensure we're not trading between same user
-            if user1_id == user2_id:
-                return jsonify({
-                    "error": "Cannot trade tickets between the same user"
-                }), 400
-            
-            # Make sure tickets are in a valid state to trade
-            if ticket1.status != "confirmed" or ticket2.status != "confirmed":
-                invalid_ticket = ticket1 if ticket1.status != "confirmed" else ticket2
-                return jsonify({
-                    "error": f"Cannot trade ticket with status: {invalid_ticket.status}. Both tickets must be confirmed."
-                }), 400
-            
-            # Swap seatIDs between the two owners
-            temp_seatID = ticket1.seatID
-            ticket1.seatID = ticket2.seatID
-            ticket2.seatID = temp_seatID
-            
-            # Commit the changes in a single transaction
-            db.session.commit()
-            
-            logger.info(f"Trade completed successfully. Seat {ticket1.seatID} now belongs to Ticket {ticket1_id} owned by {user1_id}, Seat {ticket2.seatID} now belongs to Ticket {ticket2_id} owned by {user2_id}")
-            
-            return jsonify({
-                "message": "Trade completed successfully",
-                "tradeRequestID": trade_request_id,
-                "tickets": [
-                    {
-                        "ticketID": ticket1_id,
-                        "newSeatID": ticket1.seatID
-                    },
-                    {
-                        "ticketID": ticket2_id,
-                        "newSeatID": ticket2.seatID
-                    }
-                ]
-            }), 200
+            # Step 2: Swap the seats
+            return swap_ticket_seats(
+                trade_request_id,
+                trade_data.get("ticketID"), trade_data.get("requestedTicketID"),
+                trade_data.get("requesterID"), trade_data.get("requestedUserID")
+            )
                 
         except Exception as e:
             db.session.rollback()
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds, in ms, of the connection wait-time histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class WaitHistogram:
+    """How long checkouts waited for a pooled connection, bucketed by WAIT_BUCKETS_MS."""
+
+    def __init__(self, buckets=WAIT_BUCKETS_MS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self._sum_ms = 0.0
+        self._timeouts = 0
+        self._lock = threading.Lock()
+
+    def observe(self, wait_ms):
+        index = next((i for i, bound in enumerate(self.buckets) if wait_ms <= bound), len(self.buckets))
+        with self._lock:
+            self._counts[index] += 1
+            self._sum_ms += wait_ms
+
+    def timed_out(self):
+        with self._lock:
+            self._timeouts += 1
+
+    def snapshot(self):
+        """Cumulative counts per upper bound, Prometheus style, plus totals."""
+        with self._lock:
+            counts, sum_ms, timeouts = list(self._counts), self._sum_ms, self._timeouts
+        buckets, total = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"buckets": buckets, "count": total, "sum_ms": round(sum_ms, 3), "timeouts": timeouts}
+
+
+# One engine per service process, so one histogram
+wait_histogram = WaitHistogram()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited for a connection,
+    including opening a new one when the pool is allowed to grow."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            wait_histogram.timed_out()
+            raise
+        wait_histogram.observe((time.perf_counter() - started) * 1000)
+        return connection
+
+
+def engine_options(database_uri):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS from the environment: DB_POOL_SIZE (5),
+    DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT seconds to wait for a connection
+    (30), DB_POOL_RECYCLE seconds before a connection is replaced (1800) and
+    DB_POOL_PRE_PING (true). SQLite, used for local runs, keeps its default pool.
+    """
+    if not database_uri or database_uri.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def pool_stats(engine):
+    """Current pool usage of this worker process plus its checkout wait times."""
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # QueuePool counts overflow up from -size; only connections beyond size are overflow
+            "overflow": max(pool.overflow(), 0),
+        })
+    stats["wait_ms"] = wait_histogram.snapshot()
+    return stats
@@ -0,0 +1,122 @@
+"""
+Runs a service's Flask app under gunicorn, the pre-fork WSGI server shared by
+every backend service. Each Dockerfile starts its service with e.g.
+
+    python /common/serve.py app:app --port 5005 --setup app:init_db --post-fork app:after_fork
+
+--setup names a function run once, in a separate process, before any worker
+starts (e.g. creating tables). --post-fork names a function run in each worker
+right after it is forked; it only matters with WEB_PRELOAD=true, where the app
+is imported once in the master and its connections and threads would
+otherwise be shared by every worker.
+
+Tuned through the environment:
+    WEB_WORKERS               worker processes (default 2)
+    WEB_THREADS               threads per gthread worker (default 4)
+    WEB_WORKER_CLASS          gthread (default), sync or gevent
+    WEB_WORKER_CONNECTIONS    concurrent requests per gevent worker (default 1000)
+    WEB_TIMEOUT               seconds before a stuck worker is restarted (default 60)
+    WEB_GRACEFUL_TIMEOUT      seconds in-flight requests get to finish after SIGTERM (default 30)
+    WEB_KEEPALIVE             seconds an idle keep-alive connection is held open (default 5)
+    WEB_PRELOAD               import the app in the master before forking (default false)
+
+On SIGTERM (docker stop) gunicorn stops accepting connections and lets every
+worker finish its in-flight requests for up to WEB_GRACEFUL_TIMEOUT seconds
+before exiting.
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+from gunicorn.app.base import BaseApplication
+from gunicorn.util import import_app
+
+# Service modules live in the working directory, not next to this file
+sys.path.insert(0, os.getcwd())
+
+
+def load_function(spec):
+    module_name, function_name = spec.split(":", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_setup(spec):
+    # In a child process, so the master never imports the app (and its
+    # connections) unless preloading was asked for
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--call", spec], check=True)
+
+
+def server_options(port, post_fork_spec=None):
+    # Exported so apps can tell whether per-process state is shared by all requests
+    os.environ.setdefault("WEB_WORKERS", "2")
+    worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+    options = {
+        "bind": f"0.0.0.0:{port}",
+        "workers": int(os.getenv("WEB_WORKERS", "2")),
+        "threads": int(os.getenv("WEB_THREADS", "4")),
+        "worker_class": worker_class,
+        "worker_connections": int(os.getenv("WEB_WORKER_CONNECTIONS", "1000")),
+        "timeout": int(os.getenv("WEB_TIMEOUT", "60")),
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", "5")),
+        "preload_app": os.getenv("WEB_PRELOAD", "false").lower() == "true",
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+    def post_fork(server, worker):
+        if worker_class == "gevent":
+            # psycopg2 blocks the whole worker unless it yields to gevent
+            try:
+                from psycogreen.gevent import patch_psycopg
+                patch_psycopg()
+            except ImportError:
+                pass
+
+        # Without preloading the worker has not imported the app yet, so there
+        # is nothing inherited to replace
+        if post_fork_spec and post_fork_spec.split(":", 1)[0] in sys.modules:
+            load_function(post_fork_spec)()
+            server.log.info(f"Worker {worker.pid} re-initialised by {post_fork_spec}")
+
+    options["post_fork"] = post_fork
+    return options
+
+
+class FlaskServer(BaseApplication):
+    def __init__(self, app_spec, options):
+        self.app_spec = app_spec
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return import_app(self.app_spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("app", nargs="?", help="module:variable of the Flask app, e.g. app:app")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--setup", help="module:function to run once before serving")
+    parser.add_argument("--post-fork", help="module:function to run in each preloaded worker after fork")
+    parser.add_argument("--call", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.call:
+        load_function(args.call)()
+        return
+    if not args.app:
+        parser.error("the app to serve is required, e.g. app:app")
+
+    if args.setup:
+        run_setup(args.setup)
+    FlaskServer(args.app, server_options(args.port, args.post_fork)).run()
+
+
+if __name__ == "__main__":
+    main()
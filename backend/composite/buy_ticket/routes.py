@@ -2,7 +2,8 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
 import uuid  # For generating idempotency keys
-import random # For randomly assigning seats
+import os
+from waiting_room import WaitingRoom
 
 app = Flask(__name__)
 CORS(app)
@@ -10,78 +11,141 @@ CORS(app)
 SEAT_SERVICE_URL = "http://seatalloc_service:5000" 
 PAYMENT_SERVICE_URL = "http://payment_service:5001"
 TICKET_SERVICE_URL = "http://ticket_service:5005"
+TICKET_SERVICE_TIMEOUT = 10  # seconds
+SEAT_SERVICE_TIMEOUT = 10  # seconds
+# Kept well inside the seat hold (SEAT_HOLD_SECONDS, 360 by default), which
+# purchase restarts just before charging, so the seats can't lapse mid-payment
+PAYMENT_SERVICE_TIMEOUT = 60  # seconds
+
+# Admission control for /lock: users queue per event and are let through at
+# WAITING_ROOM_RATE per second, so the seat and ticket services see a bounded load
+WAITING_ROOM_ENABLED = os.getenv("WAITING_ROOM_ENABLED", "true").lower() == "true"
+waiting_room = WaitingRoom(
+    rate=float(os.getenv("WAITING_ROOM_RATE", "20")),
+    burst=int(os.getenv("WAITING_ROOM_BURST", "50")),
+    admission_ttl=int(os.getenv("WAITING_ROOM_ADMISSION_TTL", "600"))
+)
+
+# Join the waiting room for an event
+# Expects {"userID": ...}; returns a token plus position/ETA (or admitted=true)
+@app.route("/queue/<event_id>", methods=["POST"])
+def join_queue(event_id):
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("userID")
+    if not user_id:
+        return jsonify({"error": "Missing userID"}), 400
+
+    return jsonify(waiting_room.join(event_id, str(user_id))), 200
+
+# Poll a waiting room token for position/ETA
+@app.route("/queue/<event_id>/<token>", methods=["GET"])
+def queue_status(event_id, token):
+    status = waiting_room.status(event_id, token)
+    if status is None:
+        return jsonify({"error": "Queue token not found or expired"}), 404
+
+    return jsonify(status), 200
+
+# Conditional GET support: forward the client's If-None-Match to Seat Allocation,
+# and relay its ETag (or its 304) back, so unchanged availability is not re-sent
+def conditional_headers():
+    if_none_match = request.headers.get("If-None-Match")
+    return {"If-None-Match": if_none_match} if if_none_match else {}
+
+def relay_etag(seat_response, body=None):
+    if seat_response.status_code == 304:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(body)
+    for header in ("ETag", "Cache-Control"):
+        if header in seat_response.headers:
+            response.headers[header] = seat_response.headers[header]
+    return response
 
 @app.route("/view_availability/<event_id>")
 def view_availability(event_id):
-    seat_check_response = requests.get(f"{SEAT_SERVICE_URL}/availability/{event_id}")
+    # Pass filters/projection/pagination (category, fields, limit, after) through
+    seat_check_response = requests.get(
+        f"{SEAT_SERVICE_URL}/availability/{event_id}", params=request.args, headers=conditional_headers()
+    )
+    if seat_check_response.status_code == 304:
+        return relay_etag(seat_check_response)
     if seat_check_response.status_code != 200:
         return(jsonify({"error":"No available seats"}))
     
     available_seats = seat_check_response.json().get("available_seats", [])
     if not available_seats:
         return(jsonify({"error":"No available seats"}))
-    return jsonify({"available_seats": available_seats}),200
+    return relay_etag(seat_check_response, {"available_seats": available_seats}), 200
+
+# Seat counts per category, without downloading any seats
+@app.route("/availability/<event_id>/summary")
+def availability_summary(event_id):
+    summary_response = requests.get(
+        f"{SEAT_SERVICE_URL}/availability/{event_id}/summary", headers=conditional_headers()
+    )
+    if summary_response.status_code == 304:
+        return relay_etag(summary_response)
+    if summary_response.status_code != 200:
+        return jsonify({"error": "Unable to fetch seat availability"}), summary_response.status_code
+
+    return relay_etag(summary_response, summary_response.json()), 200
 
 @app.route("/availability/<event_id>/<category>")
 def check_category_availability(event_id, category):
-    # Step 1: Call Seat Allocation Service to get all available seats for the event
-    seat_check_response = requests.get(f"{SEAT_SERVICE_URL}/availability/{event_id}")
+    # Call Seat Allocation Service for the available seats in this category only
+    seat_check_response = requests.get(
+        f"{SEAT_SERVICE_URL}/availability/{event_id}",
+        params={"category": category, "fields": "seatid,cat_no,section,seat_no"},
+        headers=conditional_headers()
+    )
 
+    if seat_check_response.status_code == 304:
+        return relay_etag(seat_check_response)
     if seat_check_response.status_code != 200:
         return jsonify({"error": "Unable to fetch seat availability"}), seat_check_response.status_code
     
-    # Step 2: Filter seats based on selected category
     available_seats = seat_check_response.json().get("available_seats", [])
-    filtered = [seat for seat in available_seats if seat["cat_no"] == category]
 
-    return jsonify({
-        "available_seats": filtered,
-        "count": len(filtered)
+    return relay_etag(seat_check_response, {
+        "available_seats": available_seats,
+        "count": len(available_seats)
     }), 200
 
-# Get all tickets for user and event with pending_payment status
-@app.route('/tickets/pending/<event_id>/<category>/<user_id>', methods=['GET'])
-def get_pending_tickets(event_id, category, user_id):
+# A user's pending tickets for an event and category, as (body, status code).
+# Called directly by lock, purchase and timeout rather than over HTTP, so a
+# request never waits on another request to this same service.
+def find_pending_tickets(event_id, category, user_id):
     try:
-        # Step 1: Fetch ALL tickets from Ticket Service
-        ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/user/{user_id}")
+        # Fetch only this user's pending tickets for the event and category from
+        # Ticket Service; the seat category is stored on each ticket
+        ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/user/{user_id}", params={
+            "eventID": event_id,
+            "status": "pending_payment",
+            "cat_no": category,
+            "fields": "ticketID,seatID"
+        }, timeout=TICKET_SERVICE_TIMEOUT)
+        if ticket_response.status_code == 404:
+            return {"ticket_ids": [], "seat_ids": []}, 404
         if ticket_response.status_code != 200:
-            return jsonify({"error": "Failed to retrieve user tickets"}), 500
-        
-        user_tickets = ticket_response.json()  # [{ticketID, eventID, seatID, userID, status}, ...]
-
-        # Step 2: Filter for pending tickets for the given event
-        pending_tickets = [
-            t for t in user_tickets
-            if t.get("eventID") == event_id and t.get("status") == "pending_payment"
-        ]
-
-        if not pending_tickets:
-            return jsonify({"ticket_ids": [], "seat_ids": []}), 404
-
-        filtered = []
-        for ticket in pending_tickets:
-            seat_id = ticket["seatID"]
-            seat_response = requests.get(f"{SEAT_SERVICE_URL}/seat/details/{seat_id}")
-            if seat_response.status_code == 200:
-                seat_data = seat_response.json()
-                if seat_data.get("cat_no") == category:
-                    filtered.append({
-                        "ticketID": ticket["ticketID"],
-                        "seatID": ticket["seatID"]
-                    })
-
-        if not filtered:
-            return jsonify({"ticket_ids": [], "seat_ids": []}), 404
-        
-        return jsonify({
-            "ticket_ids": [t["ticketID"] for t in filtered],
-            "seat_ids": [t["seatID"] for t in filtered]
-        }), 200
+            return {"error": "Failed to retrieve user tickets"}, 500
+
+        pending_tickets = ticket_response.json()  # [{ticketID, seatID}, ...]
+
+        return {
+            "ticket_ids": [t["ticketID"] for t in pending_tickets],
+            "seat_ids": [t["seatID"] for t in pending_tickets]
+        }, 200
 
     except Exception as e:
         print(f"Error retrieving pending tickets: {str(e)}")
-        return jsonify({"error": "Failed to retrieve pending tickets"}), 500
+        return {"error": "Failed to retrieve pending tickets"}, 500
+
+# Get all tickets for user and event with pending_payment status
+@app.route('/tickets/pending/<event_id>/<category>/<user_id>', methods=['GET'])
+def get_pending_tickets(event_id, category, user_id):
+    body, status_code = find_pending_tickets(event_id, category, user_id)
+    return jsonify(body), status_code
 
 # Reserve seat and creates pending ticket (no payment yet)
 @app.route("/lock/<event_id>/<category>", methods=["POST"])
@@ -92,54 +156,46 @@ def lock(event_id, category):
 
     if not category:
         return jsonify({"error": "Missing seat category"}), 400
+
+    # Only users admitted through the waiting room may lock seats
+    admission_token = request.headers.get("X-Admission-Token") or data.get("admission_token")
+    if WAITING_ROOM_ENABLED and not waiting_room.is_admitted(event_id, admission_token, str(user_id)):
+        return jsonify({"error": "A valid admission token is required. Join the queue at /queue/<event_id> first."}), 403
     
     # Step 0: Check for existing pending tickets
-    check_url = f"http://localhost:8002/tickets/pending/{event_id}/{category}/{user_id}"
-    pending_response = requests.get(check_url)
+    pending, pending_status = find_pending_tickets(event_id, category, user_id)
 
     ticket_ids = []
     seat_ids = []
 
-    if pending_response.status_code == 200:
-        pending = pending_response.json()
+    if pending_status == 200:
         if len(pending["ticket_ids"]) >= quantity:
             ticket_ids = pending["ticket_ids"][:quantity]
             seat_ids = pending["seat_ids"][:quantity]
     
     if not ticket_ids or len(ticket_ids) < quantity:
-        # Step 1: Check Seat Availability
-        seat_check_response = requests.get(f"{SEAT_SERVICE_URL}/availability/{event_id}")
-        if seat_check_response.status_code != 200:
-            return jsonify({"error":"No available seats"}), 500
-        
-        available_seats = seat_check_response.json().get("available_seats", [])
-        
-        # 2. Filter by category
-        seats_in_category = [s for s in available_seats if s["cat_no"] == category]
-        
-        # 3. Auto-pick seat(s)
-        if len(seats_in_category) < quantity:
-            return jsonify({"error": f"Only {len(seats_in_category)} seats available in {category}"}), 409
-        
-        selected_seats = random.sample(seats_in_category, quantity)
-        
-        # Step 2: Reserve the Seat
-        for seat in selected_seats:
-            seat_id = seat["seatid"]
-        
-            reserve_response = requests.post(f"{SEAT_SERVICE_URL}/reserve/{seat_id}")
-            if reserve_response.status_code != 200:
-                return jsonify({"error": f"Failed to reserve seat {seat_id}"}), 500
-            
-            # Step 3: Create pending ticket
-            ticket_data = {'eventID':event_id, 'seatID':seat_id, 'userID':user_id}
-            pending_ticket_response = requests.post(f"{TICKET_SERVICE_URL}/ticket", json=ticket_data)
-            if pending_ticket_response.status_code not in [200,201]:
-                return jsonify({"error":"Failed to create ticket."}), 500
-            
-            ticket_id = pending_ticket_response.json().get('ticketID')
-            ticket_ids.append(ticket_id)
-            seat_ids.append(seat_id)
+        # Step 1: Let Seat Allocation pick the best adjacent seats and reserve them in one call
+        reserve_response = requests.post(
+            f"{SEAT_SERVICE_URL}/reserve/best-available/{event_id}/{category}",
+            json={"quantity": quantity}
+        )
+        if reserve_response.status_code == 409:
+            return jsonify({"error": reserve_response.json().get("error")}), 409
+        if reserve_response.status_code != 200:
+            return jsonify({"error": "Failed to reserve seats"}), 500
+
+        selected_seat_ids = reserve_response.json().get("seat_ids", [])
+
+        # Step 2: Create the pending tickets for all reserved seats in one call
+        tickets_data = [{'eventID':event_id, 'seatID':seat_id, 'userID':user_id, 'cat_no':category} for seat_id in selected_seat_ids]
+        pending_ticket_response = requests.post(f"{TICKET_SERVICE_URL}/tickets/batch", json={"tickets": tickets_data})
+        if pending_ticket_response.status_code not in [200,201]:
+            # No ticket was created, so the seats can go straight back on sale
+            requests.put(f"{SEAT_SERVICE_URL}/release/reserved/batch", json={"seat_ids": selected_seat_ids})
+            return jsonify({"error":"Failed to create ticket."}), 500
+
+        ticket_ids = pending_ticket_response.json().get('ticketIDs', [])
+        seat_ids = selected_seat_ids
     
     return jsonify({
         "message": f"Locked {quantity} seat(s)",
@@ -147,31 +203,63 @@ def lock(event_id, category):
         "seat_ids": seat_ids
     }), 200
     
+# Refunds a purchase's charge. The refund's idempotency key is derived from the
+# purchase's own key, so refunding the same purchase twice only refunds once.
+def refund_purchase(stripe_id, purchase_idempotency_key):
+    refund_data = {
+        "stripeID": stripe_id,
+        "idempotency_key": str(uuid.uuid5(uuid.NAMESPACE_URL, f"refund/{purchase_idempotency_key}"))
+    }
+    try:
+        refund_response = requests.post(f"{PAYMENT_SERVICE_URL}/refund", json=refund_data, timeout=PAYMENT_SERVICE_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Refund of {stripe_id} failed: {str(e)}")
+        return False
+    if refund_response.status_code != 201:
+        print(f"Refund of {stripe_id} failed: {refund_response.status_code} {refund_response.text}")
+        return False
+    return True
+
+# Voids pending tickets, e.g. of a purchase that was refunded
+def void_tickets(ticket_ids):
+    try:
+        void_response = requests.put(
+            f"{TICKET_SERVICE_URL}/tickets/void", json={"ticketIDs": ticket_ids}, timeout=TICKET_SERVICE_TIMEOUT
+        )
+    except requests.RequestException as e:
+        print(f"Voiding tickets {ticket_ids} failed: {str(e)}")
+        return
+    if void_response.status_code != 200:
+        print(f"Voiding tickets {ticket_ids} failed: {void_response.status_code} {void_response.text}")
+
 @app.route("/purchase/<event_id>/<category>", methods=["POST"])
 def purchase(event_id, category):
     data = request.json
     user_id = data.get("userID")
     quantity = data.get("quantity", 1)
     source = data.get("source")  # e.g. "tok_visa"
-    idempotency_key = str(uuid.uuid4())
 
     if not category:
         return jsonify({"error": "Missing seat category"}), 400
     
     # Fetch pending tickets
-    pending_url = f"http://localhost:8002/tickets/pending/{event_id}/{category}/{user_id}"
-    pending_response = requests.get(pending_url)
+    pending_data, pending_status = find_pending_tickets(event_id, category, user_id)
 
-    if pending_response.status_code != 200:
+    if pending_status != 200:
         return jsonify({"error": "No pending tickets found. Please select and reserve seats first."}), 400
     
-    pending_data = pending_response.json()
     ticket_ids = pending_data.get("ticket_ids", [])
     seat_ids = pending_data.get("seat_ids", [])
 
     if len(ticket_ids) != len(seat_ids) or len(ticket_ids) != quantity:
         return jsonify({"error": "Pending ticket-seat mismatch or quantity mismatch"}), 400
 
+    # Retrying the same purchase (same pending tickets, same card) reuses the
+    # key, so the payment service replays its answer instead of charging again
+    idempotency_key = data.get("idempotency_key") or str(
+        uuid.uuid5(uuid.NAMESPACE_URL, f"purchase/{user_id}/{','.join(sorted(ticket_ids))}/{source}")
+    )
+
     # Step 1: Calculate price
     category_prices = {
         "vip": 399.00,
@@ -187,34 +275,65 @@ def purchase(event_id, category):
     # Convert to cents
     total_amount = int(price * quantity)
 
-    # Step 2: Call Payment API
+    # Step 2: Restart the seat holds. Seat Allocation releases lapsed holds on
+    # its own, and a seat released while the card is charged can't be confirmed.
+    extend_response = requests.put(
+        f"{SEAT_SERVICE_URL}/extend/batch", json={"seat_ids": seat_ids}, timeout=SEAT_SERVICE_TIMEOUT
+    )
+    if extend_response.status_code != 200:
+        return jsonify({
+            "error": "Your seat hold has expired. Please select your seats again.",
+            "results": extend_response.json().get("results", [])
+        }), 409
+
+    # Step 3: Call Payment API
     payment_data = {
         "amount": total_amount, 
         "currency": "SGD", 
         "source": source, 
         "idempotency_key":idempotency_key
     }
-    payment_response = requests.post(f"{PAYMENT_SERVICE_URL}/payment", json=payment_data)
+    try:
+        payment_response = requests.post(f"{PAYMENT_SERVICE_URL}/payment", json=payment_data, timeout=PAYMENT_SERVICE_TIMEOUT)
+    except requests.RequestException as e:
+        # A retry with the same key replays the charge if it did go through
+        print(f"Payment request failed: {str(e)}")
+        payment_response = None
 
-    if payment_response.status_code != 200:
+    if payment_response is None or payment_response.status_code != 200:
         return jsonify({
             "error": "Payment failed", 
             "ticket_ids": ticket_ids, 
             "retry_possible": True
         }), 402
 
-    # Step 3: Confirm all seats + tickets
+    # Step 4: Confirm all seats + tickets
     transaction_id = payment_response.json().get("transactionID")
     transaction_data = {"transactionID": transaction_id}
 
-    for ticket_id, seat_id in zip(ticket_ids, seat_ids):
-        confirm_seat_response = requests.put(f"{SEAT_SERVICE_URL}/confirm/{seat_id}", json={'seat_id':seat_id})
-        if confirm_seat_response.status_code != 200:
-            return jsonify({"error": f"Failed to confirm seat {seat_id}"}), 500
-    
-        confirm_ticket_response = requests.put(f"{TICKET_SERVICE_URL}/ticket/confirm/{ticket_id}", json=transaction_data)
-        if confirm_ticket_response.status_code != 200:
-            return jsonify({"error": f"Failed to confirm ticket {ticket_id}"}), 500
+    confirm_seat_response = requests.put(f"{SEAT_SERVICE_URL}/confirm/batch", json={"seat_ids": seat_ids})
+    if confirm_seat_response.status_code != 200:
+        # The customer has paid for seats they can't have: give the money back
+        # and void the tickets so the purchase can't be completed later
+        refunded = refund_purchase(payment_response.json().get("stripeID"), idempotency_key)
+        void_tickets(ticket_ids)
+        if not refunded:
+            return jsonify({
+                "error": "Failed to confirm seats and to refund the payment",
+                "transactionID": transaction_id,
+                "results": confirm_seat_response.json().get("results", [])
+            }), 500
+        return jsonify({
+            "error": "Your seats could not be confirmed, so the payment was refunded",
+            "results": confirm_seat_response.json().get("results", [])
+        }), 409
+
+    confirm_ticket_response = requests.put(
+        f"{TICKET_SERVICE_URL}/tickets/confirm",
+        json={"ticketIDs": ticket_ids, **transaction_data}
+    )
+    if confirm_ticket_response.status_code != 200:
+        return jsonify({"error": "Failed to confirm tickets", "results": confirm_ticket_response.json().get("results", [])}), 500
     
     return jsonify({
         "message": f"Successfully purchased {quantity} ticket(s)",
@@ -231,13 +350,11 @@ def timeout(event_id, category):
         return jsonify({"error": "Missing required fields"}), 400
     
     # Fetch pending tickets from Ticket service
-    check_url = f"http://localhost:8002/tickets/pending/{event_id}/{category}/{user_id}"
-    pending_response = requests.get(check_url)
+    pending, pending_status = find_pending_tickets(event_id, category, user_id)
 
-    if pending_response.status_code != 200:
+    if pending_status != 200:
         return jsonify({"message": "No pending tickets to void"}), 200
     
-    pending = pending_response.json()
     ticket_ids = pending.get("ticket_ids", [])
     seat_ids = pending.get("seat_ids", [])
 
@@ -246,16 +363,22 @@ def timeout(event_id, category):
     
     errors = []
 
-    for ticket_id, seat_id in zip(ticket_ids, seat_ids):
-        # Step 1: release seat
-        release_seat_response = requests.put(f"{SEAT_SERVICE_URL}/release/{seat_id}", json={'seat_id':seat_id})
-        if release_seat_response.status_code != 200:
-            errors.append(f"Seat {seat_id}: {release_seat_response.json().get('error')}")
+    # Step 1: release all seats in one call. Only seats still on hold are
+    # released, so a timeout racing a completed purchase can't free paid seats.
+    release_seat_response = requests.put(f"{SEAT_SERVICE_URL}/release/reserved/batch", json={"seat_ids": seat_ids})
+    if release_seat_response.status_code != 200:
+        for result in release_seat_response.json().get("results", []):
+            errors.append(f"Seat {result['seatid']}: {result['result']}")
 
-        # Step 2: Void pending ticket
-        void_ticket_response = requests.put(f"{TICKET_SERVICE_URL}/ticket/void/{ticket_id}", json={"ticket_id":ticket_id})
-        if void_ticket_response.status_code != 200:
-            errors.append(f"Ticket {ticket_id}: {void_ticket_response.json().get('error')}")
+    # Step 2: Void all pending tickets in one call
+    void_ticket_response = requests.put(f"{TICKET_SERVICE_URL}/tickets/void", json={"ticketIDs": ticket_ids})
+    if void_ticket_response.status_code != 200:
+        results = void_ticket_response.json().get("results")
+        if results is None:
+            errors.append(f"Tickets: {void_ticket_response.json().get('error')}")
+        for result in results or []:
+            if result["result"] not in ("voided", "already_voided"):
+                errors.append(f"Ticket {result['ticketID']}: {result['result']}")
     
     if errors:
         return jsonify({"message": "Timeout handled with some issues", "errors": errors}), 207
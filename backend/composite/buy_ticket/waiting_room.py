@@ -0,0 +1,136 @@
+import threading
+import time
+import uuid
+
+
+class EventQueue:
+    """Arrival-ordered queue for one event, drained at a fixed rate."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.issued = 0  # sequence number of the last token issued
+        self.admitted = 0  # every token with seq <= admitted may enter
+        self.allowance = float(burst)
+        self.updated_at = time.monotonic()
+
+    def advance(self, now):
+        # Token bucket: `rate` admissions accrue per second, at most `burst`
+        # can be saved up while nobody is waiting
+        self.allowance = min(self.burst, self.allowance + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        admit = min(int(self.allowance), self.issued - self.admitted)
+        self.admitted += admit
+        self.allowance -= admit
+
+
+class WaitingRoom:
+    """
+    Virtual waiting room in front of seat locking.
+
+    Each user joining an event's queue gets a token with a sequence number.
+    Per event, tokens are admitted in order at `rate` per second (with up to
+    `burst` admitted at once when the queue is quiet), so the seat and ticket
+    services see a bounded arrival rate however many users arrive together.
+    An admitted token stays valid for `admission_ttl` seconds.
+    """
+
+    def __init__(self, rate=20, burst=50, admission_ttl=600):
+        self.rate = rate
+        self.burst = burst
+        self.admission_ttl = admission_ttl
+        self._queues = {}
+        self._tokens = {}  # token -> {event_id, user_id, seq, admitted_at}
+        self._user_tokens = {}  # (event_id, user_id) -> token
+        self._lock = threading.Lock()
+
+    def _queue(self, event_id):
+        if event_id not in self._queues:
+            self._queues[event_id] = EventQueue(self.rate, self.burst)
+        return self._queues[event_id]
+
+    def join(self, event_id, user_id):
+        """Issue a queue token for a user, or return the one they already hold."""
+        with self._lock:
+            token = self._user_tokens.get((event_id, user_id))
+            if token is not None:
+                entry = self._tokens[token]
+                if not self._expired(entry):
+                    return self._status(token, entry)
+                self._forget(token)
+
+            queue = self._queue(event_id)
+            queue.issued += 1
+            if queue.issued % 1000 == 0:
+                self._purge()
+
+            token = str(uuid.uuid4())
+            entry = {"event_id": event_id, "user_id": user_id, "seq": queue.issued, "admitted_at": None}
+            self._tokens[token] = entry
+            self._user_tokens[(event_id, user_id)] = token
+            return self._status(token, entry)
+
+    def status(self, event_id, token):
+        """Position/ETA for a token, or None if it is unknown or has expired."""
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None or entry["event_id"] != event_id:
+                return None
+            if self._expired(entry):
+                self._forget(token)
+                return None
+            return self._status(token, entry)
+
+    def is_admitted(self, event_id, token, user_id=None):
+        """True if the token has been admitted to the event (and belongs to user_id, if given)."""
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None or entry["event_id"] != event_id or self._expired(entry):
+                return False
+            if user_id is not None and entry["user_id"] != user_id:
+                return False
+            return self._status(token, entry)["admitted"]
+
+    def _expired(self, entry):
+        admitted_at = entry["admitted_at"]
+        return admitted_at is not None and time.monotonic() - admitted_at > self.admission_ttl
+
+    def _status(self, token, entry):
+        now = time.monotonic()
+        queue = self._queue(entry["event_id"])
+        queue.advance(now)
+
+        if entry["seq"] <= queue.admitted:
+            if entry["admitted_at"] is None:
+                entry["admitted_at"] = now
+            return {
+                "token": token,
+                "admitted": True,
+                "position": 0,
+                "eta_seconds": 0,
+                "expires_in_seconds": int(entry["admitted_at"] + self.admission_ttl - now)
+            }
+
+        position = entry["seq"] - queue.admitted
+        return {
+            "token": token,
+            "admitted": False,
+            "position": position,
+            "eta_seconds": int(position / self.rate) + 1
+        }
+
+    def _forget(self, token):
+        entry = self._tokens.pop(token)
+        self._user_tokens.pop((entry["event_id"], entry["user_id"]), None)
+
+    def _purge(self):
+        # Start the admission clock for tokens that were admitted but never
+        # polled, then drop tokens whose admission window has passed
+        now = time.monotonic()
+        for entry in self._tokens.values():
+            if entry["admitted_at"] is None and entry["seq"] <= self._queues[entry["event_id"]].admitted:
+                entry["admitted_at"] = now
+        expired = [token for token, entry in self._tokens.items() if self._expired(entry)]
+        for token in expired:
+            self._forget(token)
@@ -35,25 +35,24 @@ def refund_eligibility(event_id):
     if not user_id:
         return jsonify({"error": "Missing userID in query params"}), 400
 
-    ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/user/{user_id}")
-    if ticket_response.status_code != 200:
+    # Step 2: Check if any of the user's paid tickets for this event is listed for trade.
+    # The Ticket Service filters in SQL, so only matching ticket IDs come back (404 if none).
+    ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/user/{user_id}", params={
+        "eventID": event_id,
+        "has_transaction": "true",
+        "listed_for_trade": "true",
+        "fields": "ticketID"
+    })
+    if ticket_response.status_code not in (200, 404):
         return jsonify({"error": "Failed to retrieve user tickets"}), 500
 
-    tickets = ticket_response.json()
-    event_tickets = [t for t in tickets if str(t["eventID"]) == str(event_id) and t["transactionID"] is not None]
-
-    logging.debug("Filtered (event) tickets: %s", event_tickets)
-
-    # Step 2: Check if any ticket is listed for trade or involved in a trade
-    for ticket in event_tickets:
-        listed_status = ticket.get("listed_for_trade")
-        # Convert to lowercase string and check if it's "true" or True boolean
-        if (isinstance(listed_status, str) and listed_status.lower() == "true") or listed_status is True:
-            return jsonify({
-                "message": "Refund not possible — some tickets are involved in a trade.",
-                "refund_eligibility": False,
-                "isTrading": True
-            }), 200
+    if ticket_response.status_code == 200:
+        logging.debug("Tickets listed for trade: %s", ticket_response.json())
+        return jsonify({
+            "message": "Refund not possible — some tickets are involved in a trade.",
+            "refund_eligibility": False,
+            "isTrading": True
+        }), 200
 
     # Step 3: Get event date
     event_response = requests.get(f"{EVENT_SERVICE_URL}EventAPI/events/{event_id}")
@@ -73,6 +72,23 @@ def refund_eligibility(event_id):
     else:
         return jsonify({"message": "Refund not possible", "refund_eligibility": False}), 200
 
+# Releases the seats that are still reserved or confirmed. /release/batch is
+# all or nothing, so seats it reports as conflicts (already available, e.g.
+# released by an earlier attempt at this cancellation) are left out and the
+# rest released again.
+def release_seats(seat_ids):
+    while seat_ids:
+        release_response = requests.put(f"{SEAT_SERVICE_URL}/release/batch", json={"seat_ids": seat_ids})
+        if release_response.status_code != 409:
+            return release_response.status_code == 200
+
+        results = release_response.json().get("results", [])
+        still_held = [result["seatid"] for result in results if result["result"] == "rolled_back"]
+        if len(still_held) == len(seat_ids):
+            return False
+        seat_ids = still_held
+    return True
+
 # Confirm transaction cancellation after checking refund validity
 '''
 Expected JSON payload:
@@ -84,7 +100,8 @@ Expected JSON payload:
 def cancel_transaction(transaction_id):
     data = request.get_json()
     refund_eligibility = data.get("refund_eligibility")
-    idempotency_key = str(uuid.uuid4())
+    # Fixed per transaction, so retrying a cancellation never refunds twice
+    idempotency_key = str(uuid.uuid5(uuid.NAMESPACE_URL, f"cancel/{transaction_id}"))
 
     if refund_eligibility is None:
         return jsonify({"error": "Refund eligibility is missing"}), 400
@@ -105,20 +122,17 @@ def cancel_transaction(transaction_id):
                 "error": "Cannot cancel transaction. One or more tickets are currently listed for trade or involved in a trade."
             }), 403
 
-    # Step 3,4: Void ticket and get response
-    for ticket in tickets:
-        ticket_id = ticket["ticketID"]
-        void_response = requests.put(f"{TICKET_SERVICE_URL}/ticket/void/{ticket_id}")
-        if void_response.status_code != 200:
-            return jsonify({"error": "Failed to void ticket", "statuscode": void_response.status_code}), 500
-
-    # Step 5: Release seat
-    for ticket in tickets:
-        # seat_id = "db634fd3-57a8-4f3a-a53d-9243f8381345" ###HARDCODED CHANGE LATER, currently only one ticket in transaction, later on use code below
-        seat_id = ticket["seatID"]
-        release_response = requests.put(f"{SEAT_SERVICE_URL}/release/{seat_id}")
-        if release_response.status_code != 200:
-            return jsonify({"error": "Failed to release seat", "statuscode": release_response.status_code}), 500
+    # Step 3: Release the seats before voiding anything, so a failure here
+    # leaves the tickets valid and the cancellation can simply be retried
+    seat_ids = [ticket["seatID"] for ticket in tickets]
+    if not release_seats(seat_ids):
+        return jsonify({"error": "Failed to release seats"}), 500
+
+    # Step 4,5: Void every ticket of the transaction in one call (tickets voided
+    # by an earlier attempt count as done)
+    void_response = requests.put(f"{TICKET_SERVICE_URL}/tickets/void/transaction/{transaction_id}")
+    if void_response.status_code != 200:
+        return jsonify({"error": "Failed to void ticket", "statuscode": void_response.status_code}), 500
 
     if refund_eligibility is True:
         # Step 6: Refund payment
@@ -1,21 +1,42 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from models import db
 from routes import register_routes
 import os
 
+# Shared with the other services from backend/common, which is on PYTHONPATH
+from pool_stats import engine_options, pool_stats
+
 def create_app():
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('TICKET_DB_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool sizing from DB_POOL_* (see backend/common/pool_stats.py)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
     db.init_app(app)
     CORS(app)
     register_routes(app)
+
+    # Connection pool usage and wait times of the worker that answers
+    @app.route("/metrics/db-pool", methods=["GET"])
+    def db_pool_metrics():
+        return jsonify(pool_stats(db.engine)), 200
+
     return app
 
 app = create_app()
 
-if __name__ == '__main__':
+# Run once before the service starts serving
+def init_db():
     with app.app_context():
         db.create_all()
+
+# Run in each server worker forked from a process that already imported the
+# app, so workers don't share the parent's pooled connections
+def after_fork():
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+if __name__ == '__main__':
+    init_db()
     app.run(host='0.0.0.0', port=8003, debug=True)
\ No newline at end of file
@@ -25,25 +25,18 @@ def register_routes(app):
     # Function to get all tickets that are listed for trade for a specific event and matches the category
     @app.route("/tickets/up-for-trade/<event_id>/<category>", methods=["GET"])
     def get_tradeable_tickets(event_id, category):
-        # Step 1: Get all tickets from Ticket Service for this event where listed_for_trade=True
-        ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/event/{event_id}")
+        # Get the tickets of this event listed for trade in this category; the
+        # Ticket Service keeps each ticket's seat category, so no seat lookups are needed
+        ticket_response = requests.get(f"{TICKET_SERVICE_URL}/tickets/event/{event_id}", params={
+            "listed_for_trade": "true",
+            "cat_no": category
+        })
+        if ticket_response.status_code == 404:
+            return jsonify([]), 200
         if ticket_response.status_code != 200:
             return jsonify({"error": "Failed to retrieve event tickets"}), 500
 
-        all_tickets = ticket_response.json()
-        listed_tickets = [t for t in all_tickets if t.get("listed_for_trade") == True]
-
-        # Step 2: Validate the seat category of each ticket via Seat Service
-        matching_tickets = []
-        for ticket in listed_tickets:
-            seat_id = ticket["seatID"]
-            seat_resp = requests.get(f"{SEAT_SERVICE_URL}/seat/details/{seat_id}")
-            if seat_resp.status_code == 200:
-                seat_data = seat_resp.json()
-                if seat_data.get("cat_no") == category:
-                    matching_tickets.append(ticket)
-
-        return jsonify(matching_tickets), 200
+        return jsonify(ticket_response.json()), 200
 
     # Function to create trade request
     @app.route('/trade-request', methods=['POST'])
@@ -276,13 +269,17 @@ def register_routes(app):
                 
             # If successful, proceed with ticket ownership transfer
             try:
-                # Use the trade_ticket_by_request_id endpoint to process the trade
+                # Hand the trade details straight to the ticket service, which swaps
+                # the seats and unlists both tickets in one locked transaction
                 print(f"Calling ticket service for trade with ID: {trade_request_id}")
                 
-                response = requests.put(
-                    f"{TICKET_SERVICE_URL}/ticket/trade/request/{trade_request_id}",
-                    json={}  # No body needed as trade request ID is in URL path
-                )
+                response = requests.put(f"{TICKET_SERVICE_URL}/tickets/trade/swap", json={
+                    "tradeRequestID": trade_request_id,
+                    "ticketID": original_message.get("ticketID"),
+                    "requestedTicketID": original_message.get("requestedTicketID"),
+                    "requesterID": original_message.get("requesterID"),
+                    "requestedUserID": original_message.get("requestedUserID")
+                })
                 
                 print(f"Trade endpoint response status: {response.status_code}")
                 print(f"Trade endpoint response body: {response.text}")
@@ -292,19 +289,6 @@ def register_routes(app):
                     ticket1_id = original_message.get("ticketID")
                     ticket2_id = original_message.get("requestedTicketID")
 
-                    # Unlist both tickets so they’re no longer available for other trade requests
-                    try:
-                        unlist_1 = requests.put(f"{TICKET_SERVICE_URL}/ticket/{ticket1_id}/list-for-trade", json={"listed_for_trade": False})
-                        unlist_2 = requests.put(f"{TICKET_SERVICE_URL}/ticket/{ticket2_id}/list-for-trade", json={"listed_for_trade": False})
-
-                        if unlist_1.status_code != 200:
-                            print(f"Warning: Failed to unlist ticket {ticket1_id}")
-                        if unlist_2.status_code != 200:
-                            print(f"Warning: Failed to unlist ticket {ticket2_id}")
-
-                    except Exception as e:
-                        print(f"Exception while unlisting tickets: {e}")
-                    
                     # Update trade row to "accepted" in DB
                     try:
                         trade_row = TradeRequest.query.filter_by(tradeRequestID=trade_request_id).first()
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import eventService from '../services/eventService';
+import buyTicketService from '../services/buyTicketService';
 import { useBuyTicket } from '../context/buyTicketContext';
 import { Badge } from '../components/ui/badge';
 import { Button } from '../components/ui/button';
@@ -60,6 +61,26 @@ const EventDetailsPage = () => {
     fetchEvent();
   }, [id, getAvailabilityByCat]);
 
+  // Keep the seat counts live: refetch them whenever the event's seats change
+  useEffect(() => {
+    let refreshTimer = null;
+    const refreshAvailability = () => {
+      // Coalesce a burst of changes into one refetch
+      if (refreshTimer) return;
+      refreshTimer = setTimeout(async () => {
+        refreshTimer = null;
+        const availability = await getAvailabilityByCat(id);
+        setEvent(current => current && { ...current, availableSeats: availability });
+      }, 1000);
+    };
+
+    const unsubscribe = buyTicketService.subscribeToSeatChanges(id, refreshAvailability, refreshAvailability);
+    return () => {
+      clearTimeout(refreshTimer);
+      unsubscribe();
+    };
+  }, [id, getAvailabilityByCat]);
+
   // Handle seat selection
   const handleCategorySelect = (category) => {
     setSelectedCategory(category);
@@ -6,7 +6,7 @@ import { Badge } from '../components/ui/badge';
 import myTicketService from '../services/myTicketService';
 import tradeService from '../services/tradeService';
 import { useAuth } from '../context/AuthContext';
-import { parseSeatDetails, getCategoryColor, getCategoryName, getCategoryColorHex } from '../utils/seatUtils';
+import { parseSeatDetails, ticketSeatDetails, getCategoryColor, getCategoryName, getCategoryColorHex } from '../utils/seatUtils';
 import { artistImageMap, getEventImage } from '../utils/imageUtils';
 
 const TradingPage = () => {
@@ -105,7 +105,7 @@ const TradingPage = () => {
           
           // Check how many are in the same category
           const sameCategory = listedForTrade.filter(t => {
-            const details = parseSeatDetails(t.seatID);
+            const details = ticketSeatDetails(t);
             return details && details.category === seatDetails.category;
           });
           console.log(`${sameCategory.length} tickets match category ${seatDetails.category}`);
@@ -633,26 +633,26 @@ const TradingPage = () => {
           ]);
           
           // Extract event IDs from seat IDs
-          const ticketSeatDetails = parseSeatDetails(ticketDetails.seatID);
-          const requestedTicketSeatDetails = parseSeatDetails(requestedTicketDetails.seatID);
+          const ticketSeat = ticketSeatDetails(ticketDetails);
+          const requestedTicketSeat = ticketSeatDetails(requestedTicketDetails);
           
           // Fetch event details for both tickets
           let ticketEventDetails = null;
           let requestedTicketEventDetails = null;
           
-          if (ticketSeatDetails?.event) {
+          if (ticketSeat?.event) {
             try {
-              ticketEventDetails = await myTicketService.getEventByEventId(ticketSeatDetails.event);
+              ticketEventDetails = await myTicketService.getEventByEventId(ticketSeat.event);
             } catch (error) {
-              console.error(`Error fetching event details for event ID ${ticketSeatDetails.event}:`, error);
+              console.error(`Error fetching event details for event ID ${ticketSeat.event}:`, error);
             }
           }
           
-          if (requestedTicketSeatDetails?.event) {
+          if (requestedTicketSeat?.event) {
             try {
-              requestedTicketEventDetails = await myTicketService.getEventByEventId(requestedTicketSeatDetails.event);
+              requestedTicketEventDetails = await myTicketService.getEventByEventId(requestedTicketSeat.event);
             } catch (error) {
-              console.error(`Error fetching event details for event ID ${requestedTicketSeatDetails.event}:`, error);
+              console.error(`Error fetching event details for event ID ${requestedTicketSeat.event}:`, error);
             }
           }
           
@@ -661,16 +661,16 @@ const TradingPage = () => {
             ...request,
             ticketDetails: {
               ...ticketDetails,
-              seatDetails: ticketSeatDetails,
-              categoryName: getCategoryName(ticketSeatDetails?.category),
+              seatDetails: ticketSeat,
+              categoryName: getCategoryName(ticketSeat?.category),
               event_name: ticketEventDetails?.EventResponse?.Artist || "Unknown Event",
               event_date: ticketEventDetails?.EventResponse?.EventDate || "Unknown Date",
               event_time: ticketEventDetails?.EventResponse?.EventTime || "Unknown Time"
             },
             requestedTicketDetails: {
               ...requestedTicketDetails,
-              seatDetails: requestedTicketSeatDetails,
-              categoryName: getCategoryName(requestedTicketSeatDetails?.category),
+              seatDetails: requestedTicketSeat,
+              categoryName: getCategoryName(requestedTicketSeat?.category),
               event_name: requestedTicketEventDetails?.EventResponse?.Artist || "Unknown Event",
               event_date: requestedTicketEventDetails?.EventResponse?.EventDate || "Unknown Date",
               event_time: requestedTicketEventDetails?.EventResponse?.EventTime || "Unknown Time"
@@ -871,7 +871,7 @@ const TradingPage = () => {
     const ticket = userTickets.find(t => t.ticketID === ticketId);
     
     if (ticket) {
-      const seatDetails = parseSeatDetails(ticket.seatID);
+      const seatDetails = ticketSeatDetails(ticket);
       return {
         eventTitle: ticket.eventTitle,
         eventDate: ticket.eventDate,
@@ -1276,7 +1276,7 @@ const TradingPage = () => {
             <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 gap-6 w-full">
               {transactionGroups.map((transaction) => {
                 const firstTicket = transaction.tickets[0];
-                const seatDetails = parseSeatDetails(firstTicket.seatID);
+                const seatDetails = ticketSeatDetails(firstTicket);
                 const categoryColor = getCategoryColor(seatDetails?.category);
                 const categoryName = getCategoryName(seatDetails?.category);
                 
@@ -1419,7 +1419,7 @@ const TradingPage = () => {
                 </h2>
                 <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 gap-6 w-full">
                 {availableTickets.map(ticket => {
-                  const seatDetails = parseSeatDetails(ticket.seatID);
+                  const seatDetails = ticketSeatDetails(ticket);
                   const categoryName = getCategoryName(seatDetails?.category);
                   const categoryColor = getCategoryColor(seatDetails?.category);
                   
@@ -1512,7 +1512,7 @@ const TradingPage = () => {
                     {selectedTicket.eventDate}
                   </p>
                   {(() => {
-                    const seatDetails = parseSeatDetails(ticketToTrade.seatID);
+                    const seatDetails = ticketSeatDetails(ticketToTrade);
                     return (
                       <p className="text-gray-300 text-sm mb-2">
                         Section {seatDetails?.section || 'Unknown'}, Seat {seatDetails?.seat || 'Unknown'}
@@ -1592,7 +1592,7 @@ const TradingPage = () => {
               
               <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-4">
                 {selectedTransaction.tickets.map(ticket => {
-                  const seatDetails = parseSeatDetails(ticket.seatID);
+                  const seatDetails = ticketSeatDetails(ticket);
                   return (
                     <Card key={ticket.ticketID} className="overflow-hidden bg-[#12203f] border border-blue-900">
                       <div className="p-4">
@@ -12,11 +12,35 @@ const buyTicketService = {
         }
     },
 
+    // Subscribe to an event's seat changes instead of re-polling availability.
+    // onReset(version) means: refetch availability, then ignore deltas up to version.
+    // The browser reconnects on its own and resumes from the last event it saw.
+    subscribeToSeatChanges: (eventID, onDelta, onReset) => {
+        const source = new EventSource(`${apiClient.defaults.baseURL}/availability/${eventID}/stream`);
+        source.addEventListener('delta', (event) => onDelta(JSON.parse(event.data)));
+        source.addEventListener('reset', (event) => onReset(JSON.parse(event.data).version));
+        return () => source.close();
+    },
+
+    // Join the event's waiting room and poll until admitted; resolves to the admission token
+    waitForAdmission: async (eventID, userID) => {
+        let status = (await apiClient.post(`/queue/${eventID}`, { userID: userID })).data;
+        while (!status.admitted) {
+            // Poll roughly as often as the queue moves, between 1 and 10 seconds
+            const waitSeconds = Math.min(Math.max(status.eta_seconds, 1), 10);
+            await new Promise(resolve => setTimeout(resolve, waitSeconds * 1000));
+            status = (await apiClient.get(`/queue/${eventID}/${status.token}`)).data;
+        }
+        return status.token;
+    },
+
     lockTicket: async (eventID, categoryID, userID, quantity) => {
         try {
+            const admissionToken = await buyTicketService.waitForAdmission(eventID, userID);
             const response = await apiClient.post(`/lock/${eventID}/${categoryID}`, {
                 userID: userID,
-                quantity: quantity
+                quantity: quantity,
+                admission_token: admissionToken
             });
             return response.data;
         }
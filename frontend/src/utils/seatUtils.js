@@ -101,6 +101,24 @@ export const parseSeatDetails = (seatID) => {
   }
 };
 
+/**
+ * Seat details for a ticket, using the category and section the ticket service
+ * stores on it and falling back to parsing the seat ID for older tickets
+ * Output has the same shape as parseSeatDetails
+ */
+export const ticketSeatDetails = (ticket) => {
+  const details = parseSeatDetails(ticket?.seatID);
+  if (!details) return null;
+
+  if (ticket.cat_no) {
+    details.category = ticket.cat_no.toLowerCase() === 'vip' ? 'VIP' : ticket.cat_no.replace(/^cat_/i, '');
+  }
+  if (ticket.section) {
+    details.section = ticket.section;
+  }
+  return details;
+};
+
 /**
  * Gets the category color based on category number
  */